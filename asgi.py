@@ -0,0 +1,304 @@
+"""
+ASGI entry point serving the same routes (/, /chat, /chat/batch, /dass21/bulk and
+/metrics), session cookie and replies as the Flask app. The debug profiler is only
+available from the Flask app.
+
+Run with any ASGI server, for example:
+    uvicorn asgi:application --workers 4
+
+Request bodies are read on the event loop; the dialog turn itself (sentiment scoring,
+session load/save and Q-value persistence) runs in a thread pool, so slow or idle
+clients cost a coroutine rather than a worker thread.
+
+The /ws WebSocket endpoint keeps the session state attached to the connection: each
+text frame (a JSON {"message": ...} object or plain text) is one turn, answered with
+a {"response": ...} frame, without re-parsing cookies or reloading the session.
+"""
+import asyncio
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from flask import render_template
+
+import chatbot
+from dass21 import cohort_stats, iter_csv, iter_json
+
+app = chatbot.app
+
+MAX_BODY_SIZE = 64 * 1024
+
+# A WebSocket connection writes its session state back after this many turns, and on close
+WS_SAVE_EVERY = 10
+
+# Threads for the blocking part of each turn
+executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="chat")
+
+session_serializer = app.session_interface.get_signing_serializer(app)
+session_cookie_name = app.config["SESSION_COOKIE_NAME"]
+
+
+def load_session_cookie(headers):
+    """Return the Flask session dictionary carried by the request's cookie, or an empty one."""
+    for name, value in headers:
+        if name == b"cookie":
+            cookie = SimpleCookie(value.decode("latin-1"))
+            morsel = cookie.get(session_cookie_name)
+            if morsel is not None:
+                try:
+                    return dict(session_serializer.loads(morsel.value))
+                except Exception:
+                    return {}
+    return {}
+
+
+def session_cookie_header(session_data):
+    """Build a Set-Cookie header in the format Flask's session interface writes."""
+    value = session_serializer.dumps(session_data)
+    cookie = f"{session_cookie_name}={value}; Path=/; HttpOnly"
+    if app.config["SESSION_COOKIE_SAMESITE"]:
+        cookie += f"; SameSite={app.config['SESSION_COOKIE_SAMESITE']}"
+    if app.config["SESSION_COOKIE_SECURE"]:
+        cookie += "; Secure"
+    return (b"set-cookie", cookie.encode("latin-1"))
+
+
+def ws_turn(session_id, state, user_input):
+    """Run one blocking dialog turn on a WebSocket connection's state."""
+    with chatbot.session_locks.hold(session_id):
+        return chatbot.generate_response(state, user_input, session_id)
+
+
+def home_page(session_id):
+    """Initialize the session's conversation state and render the chat page."""
+    chatbot.conversation_states.save(session_id, chatbot.conversation_states.load(session_id))
+    with app.app_context():
+        return render_template("index.html")
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def read_body(receive, max_size=MAX_BODY_SIZE):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > max_size:
+            raise ValueError("request body too large")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_response(send, status, body, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())] + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, data, headers=()):
+    await send_response(send, status, json.dumps(data).encode(), b"application/json", headers)
+
+
+async def send_stream(send, status, chunks, content_type):
+    """Send the text chunks of an iterator as a streamed body, producing each chunk in the thread pool."""
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+    while True:
+        chunk = await run_blocking(next, chunks, None)
+        if chunk is None:
+            break
+        await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def request_header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def ensure_session_id(session_data):
+    """Return (session_id, Set-Cookie headers) creating the session ID if the cookie had none."""
+    if "session_id" in session_data:
+        return session_data["session_id"], []
+    session_data["session_id"] = str(uuid.uuid4())
+    return session_data["session_id"], [session_cookie_header(session_data)]
+
+
+async def handle_home(scope, receive, send):
+    session_data = load_session_cookie(scope["headers"])
+    session_id, headers = ensure_session_id(session_data)
+    page = await run_blocking(home_page, session_id)
+    await send_response(send, 200, page.encode(), b"text/html; charset=utf-8", headers)
+
+
+async def handle_chat(scope, receive, send):
+    try:
+        body = await read_body(receive)
+    except ValueError:
+        await send_json(send, 413, {"error": "Request body too large"})
+        return
+    if body is None:
+        return
+    try:
+        user_input, profile = chatbot.chat_request(body)
+    except ValueError as e:
+        await send_json(send, 400, {"error": str(e)})
+        return
+
+    session_data = load_session_cookie(scope["headers"])
+    session_id, headers = ensure_session_id(session_data)
+    response = await run_blocking(chatbot.chat_turn, session_id, user_input, profile)
+    await send_json(send, 200, {"response": response}, headers)
+
+
+async def handle_chat_batch(scope, receive, send):
+    try:
+        body = await read_body(receive, chatbot.MAX_BATCH_SIZE * 1024)
+    except ValueError:
+        await send_json(send, 413, {"error": "Request body too large"})
+        return
+    if body is None:
+        return
+    session_data = load_session_cookie(scope["headers"])
+    default_session_id, headers = ensure_session_id(session_data)
+    try:
+        turns = chatbot.chat_batch_request(body, default_session_id)
+    except ValueError as e:
+        await send_json(send, 400, {"error": str(e)})
+        return
+    responses = await run_blocking(chatbot.generate_responses, turns)
+    await send_json(send, 200, {"responses": [{"session_id": session_id, "response": response}
+                                              for (session_id, _), response in zip(turns, responses)]}, headers)
+
+
+async def handle_dass21_bulk(scope, receive, send):
+    output = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("format", ["json"])[0]
+    if output not in chatbot.DASS21_BULK_FORMATS:
+        await send_json(send, 400, {"error": "format must be json, csv or cohort"})
+        return
+    try:
+        # Roughly the size of MAX_DASS21_BULK_SIZE respondents
+        body = await read_body(receive, chatbot.MAX_DASS21_BULK_SIZE * 256)
+    except ValueError:
+        await send_json(send, 413, {"error": "Request body too large"})
+        return
+    if body is None:
+        return
+    content_type = request_header(scope, b"content-type").split(";")[0].strip().lower()
+    try:
+        ids, scores, bands = await run_blocking(chatbot.dass21_bulk_request, body, content_type, output)
+    except ValueError as e:
+        await send_json(send, 400, {"error": str(e)})
+        return
+    if output == "cohort":
+        await send_json(send, 200, await run_blocking(cohort_stats, scores, bands))
+    elif output == "csv":
+        await send_stream(send, 200, iter_csv(ids, scores, bands), b"text/csv; charset=utf-8")
+    else:
+        await send_stream(send, 200, iter_json(ids, scores, bands), b"application/json")
+
+
+async def handle_metrics(scope, receive, send):
+    body = chatbot.metrics_registry.render().encode()
+    await send_response(send, 200, body, b"text/plain; version=0.0.4; charset=utf-8")
+
+
+routes = {
+    ("GET", "/"): handle_home,
+    ("GET", "/metrics"): handle_metrics,
+    ("POST", "/chat"): handle_chat,
+    ("POST", "/chat/batch"): handle_chat_batch,
+    ("POST", "/dass21/bulk"): handle_dass21_bulk
+}
+
+
+def parse_ws_message(message):
+    text = message.get("text")
+    if text is None:
+        text = (message.get("bytes") or b"").decode("utf-8", errors="replace")
+    if text.startswith("{"):
+        try:
+            return str(json.loads(text).get("message", "")).strip()
+        except (ValueError, AttributeError):
+            pass
+    return text.strip()
+
+
+async def handle_websocket(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if scope["path"] != "/ws":
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    session_data = load_session_cookie(scope["headers"])
+    session_id, headers = ensure_session_id(session_data)
+    await send({"type": "websocket.accept", "headers": headers})
+
+    # The state stays attached to this connection for its whole lifetime
+    state = await run_blocking(chatbot.conversation_states.load, session_id)
+    unsaved_turns = 0
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message["type"] != "websocket.receive":
+                continue
+            user_input = parse_ws_message(message)
+            response = await run_blocking(ws_turn, session_id, state, user_input)
+            await send({"type": "websocket.send", "text": json.dumps({"response": response})})
+            unsaved_turns += 1
+            if unsaved_turns >= WS_SAVE_EVERY:
+                await run_blocking(chatbot.conversation_states.save, session_id, state)
+                unsaved_turns = 0
+    finally:
+        if unsaved_turns:
+            await run_blocking(chatbot.conversation_states.save, session_id, state)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Persist any Q-value updates and conversation turns still waiting to be written
+            await run_blocking(chatbot.q_journal.close)
+            await run_blocking(chatbot.q_contexts.close)
+            await run_blocking(chatbot.conversation_log.close)
+            await run_blocking(chatbot.profile_store.close)
+            if chatbot.q_sync is not None:
+                await run_blocking(chatbot.q_sync.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] == "websocket":
+        await handle_websocket(scope, receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    handler = routes.get((scope["method"], scope["path"]))
+    if handler is None:
+        if any(path == scope["path"] for method, path in routes):
+            await send_json(send, 405, {"error": "Method not allowed"})
+        else:
+            await send_json(send, 404, {"error": "Not found"})
+        return
+    await handler(scope, receive, send)
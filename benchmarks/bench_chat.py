@@ -0,0 +1,266 @@
+"""
+Load and latency benchmark for the chat dialog.
+
+Drives scenario mixes that hit every branch of chat() through Flask's test client
+and/or a real local HTTP server, reports throughput and p50/p95/p99 latency per
+branch and for the whole mix, and runs microbenchmarks of the hot helpers.
+Results can be saved as JSON and compared with an earlier run.
+
+Run from the repository root:
+    python benchmarks/bench_chat.py
+    python benchmarks/bench_chat.py --transport server --concurrency 8 --output after.json
+    python benchmarks/bench_chat.py --compare before.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib.request
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Each scenario is a conversation of (branch, message) turns from a fresh session
+SCENARIOS = {
+    "greeting": [("greeting", "hi")],
+    "faq": [("faq", "what can you do?")],
+    "positive": [("positive", "I'm feeling great today")],
+    "sad": [("sad", "I feel so sad and lonely")],
+    "anxiety": [("anxiety", "I'm really anxious about tomorrow")],
+    "stress": [("stress", "I'm so stressed at work")],
+    "anxiety_followup": [("anxiety", "I feel nervous"), ("anxiety_followup", "no, not really")],
+    "stress_followup": [("stress", "Work has been so stressful"), ("stress_followup", "nope")],
+    "default": [("default", "I went to the shop earlier")],
+    "general": [("default", "The weather is okay"), ("default", "I had lunch"), ("general", "I read a book")],
+    "dass21": [("dass21_start", "I'd like to take the DASS-21")]
+              + [("dass21_answer", str(i % 4)) for i in range(20)]
+              + [("dass21_result", "2")],
+}
+
+DEFAULT_MIX = {
+    "greeting": 10, "faq": 5, "positive": 10, "sad": 10, "anxiety": 10, "stress": 10,
+    "anxiety_followup": 8, "stress_followup": 8, "default": 10, "general": 5, "dass21": 4,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_seconds):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput_rps": len(values) / wall_seconds if wall_seconds else 0.0,
+        "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+    }
+
+
+class TestClientUser:
+    """A virtual user talking to the app through Flask's test client."""
+
+    def __init__(self, app, base_url=None):
+        self.client = app.test_client()
+
+    def send(self, message):
+        response = self.client.post("/chat", json={"message": message})
+        return response.get_json()["response"]
+
+
+class HTTPUser:
+    """A virtual user talking to a real server over HTTP, with its own cookie jar."""
+
+    def __init__(self, app, base_url):
+        self.url = base_url + "/chat"
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def send(self, message):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({"message": message}).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        with self.opener.open(request) as response:
+            return json.loads(response.read())["response"]
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+
+    # Per-request access log lines would swamp the results
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_load(app, user_class, base_url, mix, conversations, concurrency, seed):
+    """Run `conversations` scenario conversations split over `concurrency` threads."""
+    rng = random.Random(seed)
+    names = list(mix)
+    plan = rng.choices(names, weights=[mix[name] for name in names], k=conversations)
+    shards = [plan[i::concurrency] for i in range(concurrency)]
+    results = [[] for _ in range(concurrency)]
+
+    def worker(shard, out):
+        for scenario in shard:
+            user = user_class(app, base_url)
+            for branch, message in SCENARIOS[scenario]:
+                started = time.perf_counter()
+                user.send(message)
+                out.append((branch, time.perf_counter() - started))
+
+    threads = [threading.Thread(target=worker, args=(shard, out)) for shard, out in zip(shards, results)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    samples = [sample for out in results for sample in out]
+    by_branch = {}
+    for branch, latency in samples:
+        by_branch.setdefault(branch, []).append(latency)
+    return {
+        "wall_seconds": wall,
+        "overall": summarize([latency for _, latency in samples], wall),
+        "branches": {branch: summarize(latencies, wall) for branch, latencies in sorted(by_branch.items())},
+    }
+
+
+def run_micro(chatbot, number):
+    """Time the helpers on the request path, in microseconds per call."""
+    table = chatbot.positive_responses
+    response = next(iter(table))
+    message = "I've been really stressed and anxious, not feeling great"
+    chatbot.sentiment.score(message)
+    # One non-DASS turn of the scenario mix per call, from a fresh session state
+    from sessions import SessionState
+    turns = itertools.cycle([text for name, turns in SCENARIOS.items() if name != "dass21" for _, text in turns])
+    cases = {
+        "select_response": lambda: chatbot.select_response(table),
+        "update_q_value": lambda: chatbot.update_q_value(table, response, 1),
+        "intent_matcher": lambda: chatbot.dialog_engine.current.intents(message),
+        "check_for_faq": lambda: chatbot.check_for_faq(message),
+        "dialog_turn": lambda: chatbot.dialog_turn(SessionState(), next(turns)),
+        "dass21_answer": lambda: chatbot.dialog_turn(SessionState(in_dass21=True), "sometimes"),
+        "sentiment_cached": lambda: chatbot.sentiment.score(message),
+        "sentiment_uncached": lambda: chatbot.sentiment.analyzer.polarity_scores(message),
+    }
+    return {name: 1e6 * timeit.timeit(func, number=number) / number for name, func in cases.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_load(label, result):
+    print(f"\n{label}: {result['overall']['requests']} requests in {result['wall_seconds']:.2f}s")
+    print(f"{'branch':<18} {'n':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = list(result["branches"].items()) + [("ALL", result["overall"])]
+    for branch, stats in rows:
+        print(f"{branch:<18} {stats['requests']:>6} {stats['throughput_rps']:>9.1f} "
+              f"{stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+
+
+def print_comparison(old, new):
+    print("\nComparison with baseline (p50 ms, micro us/call)")
+    for transport, result in new["load"].items():
+        old_result = old.get("load", {}).get(transport)
+        if old_result is None:
+            continue
+        rows = list(result["branches"].items()) + [("ALL", result["overall"])]
+        for branch, stats in rows:
+            before = old_result["overall"] if branch == "ALL" else old_result["branches"].get(branch)
+            if before and before["p50_ms"]:
+                change = 100 * (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"]
+                print(f"{transport:<8} {branch:<18} {before['p50_ms']:>8.3f} -> {stats['p50_ms']:>8.3f} ({change:+.1f}%)")
+    for name, value in new["micro"].items():
+        before = old.get("micro", {}).get(name)
+        if before:
+            print(f"micro    {name:<18} {before:>8.2f} -> {value:>8.2f} ({100 * (value - before) / before:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["client", "server", "both"], default="client")
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--micro-number", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="compare with results saved by an earlier run")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    # Run in a scratch directory so learned Q-values never touch the repository's q_values.json
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    shutil.copy(os.path.join(ROOT, "q_values.json"), workdir)
+    os.chdir(workdir)
+    random.seed(args.seed)
+    import chatbot
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "settings": vars(args),
+        "load": {},
+        "micro": run_micro(chatbot, args.micro_number),
+    }
+    transports = ["client", "server"] if args.transport == "both" else [args.transport]
+    for transport in transports:
+        if transport == "client":
+            results["load"]["client"] = run_load(chatbot.app, TestClientUser, None, DEFAULT_MIX,
+                                                 args.conversations, args.concurrency, args.seed)
+        else:
+            server, base_url = start_server(chatbot.app)
+            try:
+                results["load"]["server"] = run_load(chatbot.app, HTTPUser, base_url, DEFAULT_MIX,
+                                                     args.conversations, args.concurrency, args.seed)
+            finally:
+                server.shutdown()
+
+    for transport, result in results["load"].items():
+        print_load(transport, result)
+    print("\nmicrobenchmarks (us/call)")
+    for name, value in results["micro"].items():
+        print(f"{name:<20} {value:>9.2f}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if compare:
+        with open(compare) as f:
+            print_comparison(json.load(f), results)
+    chatbot.q_journal.close()
+    chatbot.q_contexts.close()
+    chatbot.conversation_log.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
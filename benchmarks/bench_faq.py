@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: FAQ lookup latency as the number of entries grows.
+
+Builds FAQEngine indexes of synthetic entries on top of the built-in ones and times
+exact-phrase hits, paraphrase (typo) hits and misses, plus re-indexing one entry.
+
+Run from the repository root:
+    python benchmarks/bench_faq.py
+    python benchmarks/bench_faq.py --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faq import FAQEngine
+
+WORDS = ("appointment clinic therapy session sleep medication insurance cancel reschedule group online "
+         "privacy data crisis hotline weekend evening referral payment waiting list counsellor family "
+         "partner exam work school breathing exercise journal mood tracker reminder language").split()
+
+messages = {
+    "exact": "what can you do for me",
+    "paraphrase": "wat can you do",
+    "miss": "I went for a walk in the park this morning and it was nice",
+}
+
+
+def synthetic_entries(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        question = f"how do i {' '.join(rng.sample(WORDS, 4))} {i}"
+        yield f"entry-{i}", [question, f"can you tell me about {' '.join(rng.sample(WORDS, 3))} {i}"], f"Answer {i}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1000, 10000, 20000])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    import chatbot
+
+    builtin = chatbot.faq.builtin
+    print(f"{'entries':>8} {'build s':>8} " + " ".join(f"{name + ' us':>14}" for name in messages) + f" {'reindex us':>11}")
+    for size in args.sizes:
+        engine = FAQEngine()
+        started = time.perf_counter()
+        engine.update(builtin)
+        for entry_id, questions, answer in synthetic_entries(size):
+            engine.upsert(entry_id, questions, answer)
+        build = time.perf_counter() - started
+        timings = [1e6 * timeit.timeit(lambda: engine.lookup(message), number=args.number) / args.number
+                   for message in messages.values()]
+        reindex = 1e6 * timeit.timeit(lambda: engine.upsert("what can you do", builtin["what can you do"]["questions"],
+                                                            "changed"), number=200) / 200
+        print(f"{len(engine):>8} {build:>8.2f} " + " ".join(f"{t:>14.1f}" for t in timings) + f" {reindex:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
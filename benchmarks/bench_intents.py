@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: single-pass IntentMatcher vs. the original per-intent substring scans.
+
+Run from the repository root:
+    python benchmarks/bench_intents.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import dialog_engine
+from intents import IntentMatcher
+
+intent_keywords = dialog_engine.current.keywords
+
+
+def legacy_intents(user_input):
+    """The original contains_* checks: lowercase and substring-scan once per intent."""
+    found = set()
+    for intent, keywords in intent_keywords.items():
+        user_input_lower = user_input.lower()
+        if any(keyword.rstrip("*") in user_input_lower for keyword in keywords):
+            found.add(intent)
+    return found
+
+
+messages = [
+    "hi",
+    "I'm feeling really anxious about my exams next week",
+    "Honestly I've been so stressed and overwhelmed at work lately",
+    "no, not really",
+    "I'm in a great mood today, feeling good!",
+    "I don't know, I just feel down and blue",
+    "Can I take the DASS-21 questionnaire please?",
+    "The weather was fine and I went to the shop to buy some groceries for dinner",
+]
+
+
+def bench(label, func, keyword_count, number=20000):
+    seconds = timeit.timeit(lambda: [func(m) for m in messages], number=number)
+    per_message = seconds / (number * len(messages)) * 1e6
+    print(f"{label:<28} {keyword_count:>6} keywords  {per_message:8.2f} us/message")
+
+
+if __name__ == "__main__":
+    matcher = IntentMatcher(intent_keywords)
+    keyword_count = sum(len(keywords) for keywords in intent_keywords.values())
+    bench("legacy substring scans", legacy_intents, keyword_count)
+    bench("IntentMatcher", matcher.intents, keyword_count)
+
+    # Grow the keyword sets to show that matching cost stays flat
+    filler = {f"filler{i}": [f"zzkeyword{i}{j}" for j in range(50)] for i in range(20)}
+    grown = dict(intent_keywords, **filler)
+    big_matcher = IntentMatcher(grown)
+    grown_count = sum(len(keywords) for keywords in grown.values())
+
+    def grown_legacy(user_input):
+        found = set()
+        for intent, keywords in grown.items():
+            user_input_lower = user_input.lower()
+            if any(keyword.rstrip("*") in user_input_lower for keyword in keywords):
+                found.add(intent)
+        return found
+
+    bench("legacy substring scans", grown_legacy, grown_count, number=2000)
+    bench("IntentMatcher", big_matcher.intents, grown_count, number=2000)
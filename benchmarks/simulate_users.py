@@ -0,0 +1,327 @@
+"""
+Synthetic user simulator for learning convergence and sustained load.
+
+Runs many concurrent synthetic users against the chat dialog, in-process (calling
+chatbot.chat_turn) or over HTTP (a local server, or --url for one already running).
+Each user talks about anxiety, stress, sadness, good news or everyday things, answers
+follow-up questions, sometimes takes the DASS-21 questionnaire, and reacts to every
+pool response with its next message, whose VADER sentiment is positive with the
+probability that users like that response (see --preferences), negative otherwise.
+This is the chatbot's reward convention: a pool response is credited with the
+sentiment of the user's next message, so a response counts once that message is sent.
+
+Every interval it reports the regret of the pool responses credited (how much less
+liked they were than the best response of their pool, averaged per response), Q-value
+updates per second and the process's resident memory. A learner that converges
+shows falling interval regret; "random regret" is what uniform choice would score.
+
+Run from the repository root:
+    python benchmarks/simulate_users.py --duration 60
+    python benchmarks/simulate_users.py --transport http --users 16 --duration 3600 --output sim.json
+    python benchmarks/simulate_users.py --url http://127.0.0.1:5000 --pid 12345
+
+A preferences file maps pool names to {response text: probability of a positive
+reaction}; responses it leaves out get --dislike. By default each pool has one
+favourite response (--like) picked with --seed.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chat import HTTPUser, ROOT, start_server
+
+# What users talk about: topic -> message templates ({} is filled with a subject)
+TOPICS = {
+    "anxiety": ["I'm anxious about {}.", "I feel nervous about {}.", "I keep getting scared about {}."],
+    "stress": ["I'm so stressed about {}.", "There's a lot of pressure with {}.", "I feel overwhelmed by {}."],
+    "sad": ["I feel sad about {}.", "I've been feeling really down about {}.", "I'm unhappy about {}."],
+    "positive": ["I'm in a great mood about {}.", "I feel cheerful about {}.", "I'm feeling upbeat about {}."],
+    "general": ["I went for a walk after {}.", "I was thinking about {} earlier.", "I had lunch before {}."],
+}
+SUBJECTS = ["work", "my exams", "my family", "the move", "tomorrow", "my job interview", "money", "the weekend"]
+
+# Reactions to the bot's last response, by the sentiment bucket they are meant to have
+REACTIONS = {
+    1: ["Thanks, that really helps.", "That's a lovely idea, thank you!", "I appreciate that, it's helpful."],
+    -1: ["That is useless and annoying.", "Ugh, that's a terrible suggestion.", "That makes me feel worse, it's awful."],
+}
+
+# Answers to follow-up questions, and to DASS-21 questions
+FOLLOWUP_ANSWERS = ["no, not really", "nope", "not really"]
+DASS21_ANSWERS = ["0", "1", "2", "3", "never", "sometimes", "often", "always"]
+
+
+def message_bank(score):
+    """
+    Return {(topic, bucket): [messages]} of reaction + topic messages whose sentiment,
+    by `score` (text -> VADER compound), is in the intended bucket.
+    """
+    from contextual import sentiment_bucket
+
+    bank = {}
+    for topic, templates in TOPICS.items():
+        for bucket, reactions in REACTIONS.items():
+            messages = [f"{reaction} {template.format(subject)}"
+                        for reaction in reactions for template in templates for subject in SUBJECTS]
+            bank[topic, bucket] = [text for text in messages if sentiment_bucket(score(text)) == bucket]
+            if not bank[topic, bucket]:
+                raise ValueError(f"No {topic!r} message has sentiment bucket {bucket}")
+    for bucket, reactions in REACTIONS.items():
+        bank["followup", bucket] = [text for text in (f"{answer}. {reaction}" for answer in FOLLOWUP_ANSWERS
+                                                      for reaction in reactions)
+                                    if sentiment_bucket(score(text)) == bucket]
+        bank["dass21", bucket] = [text for text in (f"{reaction} Can I take the DASS-21?" for reaction in reactions)
+                                  if sentiment_bucket(score(text)) == bucket]
+        for topic in ("followup", "dass21"):
+            if not bank[topic, bucket]:
+                raise ValueError(f"No {topic!r} message has sentiment bucket {bucket}")
+    return bank
+
+
+def default_preferences(pools, like, dislike, seed):
+    """One favourite response per pool, liked with probability `like`; the rest `dislike`."""
+    rng = random.Random(seed)
+    preferences = {}
+    for name, texts in pools.items():
+        favourite = rng.choice(texts)
+        preferences[name] = {text: like if text == favourite else dislike for text in texts}
+    return preferences
+
+
+def rss_bytes(pid="self"):
+    """Resident set size of a process, from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Stats:
+    """Counters shared by the user threads; read and reset per reporting interval."""
+
+    def __init__(self):
+        self.turns = 0
+        self.updates = 0
+        self.regret = 0.0
+        self.dass21_completed = 0
+        self._lock = threading.Lock()
+
+    def add(self, updates=0, regret=0.0, dass21_completed=0):
+        with self._lock:
+            self.turns += 1
+            self.updates += updates
+            self.regret += regret
+            self.dass21_completed += dass21_completed
+
+    def snapshot(self):
+        with self._lock:
+            return self.turns, self.updates, self.regret, self.dass21_completed
+
+
+class SyntheticUser:
+    """
+    One user's conversation. `send(message)` returns the bot's reply; `pool_of` maps a
+    response text to its pool name.
+    """
+
+    def __init__(self, send, rng, bank, preferences, pool_of, stats, turns, followup_rate, dass21_rate):
+        self.send = send
+        self.rng = rng
+        self.bank = bank
+        self.preferences = preferences
+        self.pool_of = pool_of
+        self.stats = stats
+        self.turns = turns
+        self.followup_rate = followup_rate
+        self.dass21_rate = dass21_rate
+        self.best = {name: max(pool.values()) for name, pool in preferences.items()}
+        # Regret of the last reply, counted when the message reacting to it is sent
+        self.pending_regret = None
+
+    def react(self, reply):
+        """Return (sentiment bucket of the user's next message, regret of `reply`)."""
+        pool = self.pool_of.get(reply)
+        if pool is None:
+            return self.rng.choice((1, -1)), None
+        liked = self.preferences[pool][reply]
+        bucket = 1 if self.rng.random() < liked else -1
+        return bucket, self.best[pool] - liked
+
+    def say(self, message):
+        regret = self.pending_regret
+        reply = self.send(message)
+        self.stats.add(updates=regret is not None, regret=regret or 0.0,
+                       dass21_completed=reply.startswith("Thank you for completing the DASS-21"))
+        bucket, self.pending_regret = self.react(reply)
+        return reply, bucket
+
+    def run(self, deadline):
+        reply, bucket = self.say("hi")
+        for _ in range(self.turns):
+            if time.monotonic() >= deadline:
+                return
+            if self.rng.random() < self.dass21_rate:
+                self.say(self.rng.choice(self.bank["dass21", bucket]))
+                for _ in range(21):
+                    reply, bucket = self.say(self.rng.choice(DASS21_ANSWERS))
+                continue
+            if self.pool_of.get(reply) in ("anxiety_responses", "stress_responses") and \
+                    self.rng.random() < self.followup_rate:
+                topic = "followup"
+            else:
+                topic = self.rng.choice(list(TOPICS))
+            reply, bucket = self.say(self.rng.choice(self.bank[topic, bucket]))
+
+
+def run_simulation(send_factory, bank, preferences, pool_of, args, sessions=None, pid="self"):
+    """Run `args.users` user threads until `args.duration` seconds pass, reporting every interval."""
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+
+    def worker(index):
+        rng = random.Random(args.seed * 100003 + index)
+        while time.monotonic() < deadline:
+            user = SyntheticUser(send_factory(), rng, bank, preferences, pool_of, stats,
+                                 args.turns, args.followup_rate, args.dass21_rate)
+            user.run(deadline)
+
+    texts = {name: list(pool) for name, pool in preferences.items()}
+    random_regret = {name: max(pool.values()) - sum(pool.values()) / len(pool) for name, pool in preferences.items()}
+    print(f"random regret per choice (mean over pools): {sum(random_regret.values()) / len(random_regret):.3f}")
+    print(f"{'seconds':>8} {'turns/s':>9} {'updates/s':>10} {'regret':>8} {'cum regret':>11} {'rss MB':>8}"
+          f"{' sessions':>10}")
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.users)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    intervals = []
+    last = (0, 0, 0.0, 0)
+    last_time = started
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=max(0.0, last_time + args.interval - time.monotonic()))
+        now = time.monotonic()
+        current = stats.snapshot()
+        seconds = max(now - last_time, 1e-9)
+        updates = current[1] - last[1]
+        rss = rss_bytes(pid)
+        row = {
+            "elapsed_seconds": now - started,
+            "turns_per_second": (current[0] - last[0]) / seconds,
+            "updates_per_second": updates / seconds,
+            "mean_regret": (current[2] - last[2]) / updates if updates else None,
+            "cumulative_regret": current[2],
+            "updates": current[1],
+            "dass21_completed": current[3],
+            "rss_bytes": rss,
+            "sessions": sessions() if sessions is not None else None,
+        }
+        intervals.append(row)
+        regret = f"{row['mean_regret']:.3f}" if row["mean_regret"] is not None else "-"
+        rss_mb = f"{rss / 2 ** 20:.1f}" if rss is not None else "-"
+        print(f"{row['elapsed_seconds']:>8.1f} {row['turns_per_second']:>9.1f} {row['updates_per_second']:>10.1f} "
+              f"{regret:>8} {current[2]:>11.1f} {rss_mb:>8} {row['sessions'] if sessions else '-':>9}")
+        last, last_time = current, now
+    return {"random_regret": random_regret, "preferences": preferences, "texts": texts, "intervals": intervals}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", help="drive an already running server at this URL (implies --transport http)")
+    parser.add_argument("--pid", help="process ID of the --url server, to report its memory")
+    parser.add_argument("--users", type=int, default=8, help="concurrent users")
+    parser.add_argument("--turns", type=int, default=20, help="turns per user before a new user takes over")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between reports")
+    parser.add_argument("--preferences", help="JSON file of {pool: {response: probability of a positive reaction}}")
+    parser.add_argument("--like", type=float, default=0.9)
+    parser.add_argument("--dislike", type=float, default=0.2)
+    parser.add_argument("--followup-rate", type=float, default=0.5,
+                        help="chance of answering an anxiety or stress response's follow-up question")
+    parser.add_argument("--dass21-rate", type=float, default=0.02, help="chance per turn of taking the DASS-21")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    preferences_path = os.path.abspath(args.preferences) if args.preferences else None
+
+    # Run in a scratch directory so learned Q-values never touch the repository's q_values.json
+    workdir = tempfile.mkdtemp(prefix="chatbot-sim-")
+    shutil.copy(os.path.join(ROOT, "q_values.json"), workdir)
+    os.chdir(workdir)
+    random.seed(args.seed)
+
+    from lexicon import load_analyzer
+
+    if args.url:
+        # The pools as the server started with them
+        with open(os.path.join(ROOT, "q_values.json")) as f:
+            pools = {name: list(pool) for name, pool in json.load(f).items() if not name.startswith("_")}
+        score = load_analyzer().polarity_scores
+        chatbot = None
+    else:
+        import chatbot
+        pools = {name: list(table.texts) for name, table in chatbot.q_tables.items()}
+        score = chatbot.sentiment.analyzer.polarity_scores
+    bank = message_bank(lambda text: score(text)["compound"])
+
+    if preferences_path:
+        with open(preferences_path) as f:
+            chosen = json.load(f)
+        preferences = {name: {text: chosen.get(name, {}).get(text, args.dislike) for text in texts}
+                       for name, texts in pools.items()}
+    else:
+        preferences = default_preferences(pools, args.like, args.dislike, args.seed)
+    pool_of = {text: name for name, texts in pools.items() for text in texts}
+
+    server = None
+    pid = "self"
+    sessions = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        pid = args.pid
+        send_factory = lambda: HTTPUser(None, base_url).send
+    else:
+        if hasattr(chatbot.conversation_states, "__len__"):
+            sessions = lambda: len(chatbot.conversation_states)
+        if args.transport == "http":
+            server, base_url = start_server(chatbot.app)
+            send_factory = lambda: HTTPUser(chatbot.app, base_url).send
+        else:
+            def send_factory():
+                session_id = str(uuid.uuid4())
+                return lambda message: chatbot.chat_turn(session_id, message)
+
+    try:
+        report = run_simulation(send_factory, bank, preferences, pool_of, args, sessions, pid)
+    finally:
+        if server is not None:
+            server.shutdown()
+    report["settings"] = vars(args)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if chatbot is not None:
+        chatbot.q_journal.close()
+        chatbot.q_contexts.close()
+        chatbot.conversation_log.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Concurrency stress test for the chat app.
+
+Checks that, under many threads:
+  * Q-value updates to one table never overlap, none is lost (every update_q_value
+    call is counted exactly once) and the journal holds each response's final value,
+  * turns of one session never overlap (concurrent DASS-21 answers sent with a
+    shared session cookie advance the questionnaire exactly once each),
+and reports chat throughput over a real HTTP server as the thread count grows.
+
+Overlaps are detected directly by wrapping QTable.learn and dialog_turn, which also
+yield to other threads mid-call so that a missing lock shows up in a short run.
+
+Run from the repository root:
+    python benchmarks/stress_concurrency.py
+    python benchmarks/stress_concurrency.py --threads 1 2 4 8 16 --updates 20000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chat import HTTPUser, ROOT, start_server
+
+
+class OverlapDetector:
+    """Wraps functions to count calls that start while another call with the same key is running."""
+
+    def __init__(self):
+        self.overlaps = 0
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, func, key):
+        def wrapper(*args, **kwargs):
+            k = key(*args)
+            with self._lock:
+                if self._active.get(k):
+                    self.overlaps += 1
+                self._active[k] = self._active.get(k, 0) + 1
+            try:
+                time.sleep(0)
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active[k] -= 1
+        return wrapper
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def check_q_updates(chatbot, threads, updates):
+    """Hammer update_q_value from many threads and count the updates that landed."""
+    tables = list(chatbot.q_tables.values())
+    before = sum(int(table.active_counts().sum()) for table in tables)
+    detector = OverlapDetector()
+    learn = chatbot.QTable.learn
+    chatbot.QTable.learn = detector.wrap(learn, lambda table, *args: id(table))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(updates):
+            table = rng.choice(tables)
+            chatbot.update_q_value(table, rng.choice(table.texts), rng.choice((-1, 0, 1)))
+
+    try:
+        seconds = run_threads(threads, worker)
+    finally:
+        chatbot.QTable.learn = learn
+    applied = sum(int(table.active_counts().sum()) for table in tables) - before
+    expected = threads * updates
+
+    # The journal must end up with the same values as the tables
+    chatbot.q_journal.flush()
+    replayed = {name: {} for name in chatbot.q_tables}
+    chatbot.replay_q_values(chatbot.q_journal.filepath, replayed)
+    journal_ok = all(replayed[name].get(text, value) == value
+                     for name, table in chatbot.q_tables.items() for text, value in table.items())
+    print(f"q updates: {applied}/{expected} applied in {seconds:.2f}s, overlapping updates: "
+          f"{detector.overlaps}, journal matches tables: {journal_ok}")
+    return applied == expected and journal_ok and detector.overlaps == 0
+
+
+def check_session_ordering(chatbot, threads):
+    """Send DASS-21 answers concurrently with one session cookie."""
+    client = chatbot.app.test_client()
+    client.post("/chat", json={"message": "dass-21"})
+    answers = min(threads, 20)
+    lock = threading.Lock()
+    replies = []
+
+    def worker(_):
+        response = client.post("/chat", json={"message": "1"}).get_json()["response"]
+        with lock:
+            replies.append(response)
+
+    detector = OverlapDetector()
+    dialog_turn = chatbot.dialog_turn
+    chatbot.dialog_turn = detector.wrap(dialog_turn, lambda state, *args: id(state))
+    try:
+        run_threads(answers, worker)
+    finally:
+        chatbot.dialog_turn = dialog_turn
+    with client.session_transaction() as cookie:
+        session_id = cookie["session_id"]
+    state = chatbot.conversation_states.load(session_id)
+    numbers = sorted(int(reply.split("/")[0].rsplit(" ", 1)[-1]) for reply in replies)
+    ok = (state.dass21_question_index == answers and numbers == list(range(2, answers + 2))
+          and detector.overlaps == 0)
+    print(f"session ordering: {answers} concurrent answers -> question index {state.dass21_question_index}, "
+          f"distinct questions asked: {len(set(numbers))}, overlapping turns: {detector.overlaps}")
+    return ok
+
+
+def measure_throughput(chatbot, thread_counts, requests_per_thread):
+    server, base_url = start_server(chatbot.app)
+    messages = ["hi", "I'm feeling great today", "I feel so sad", "I'm anxious", "no", "what can you do?"]
+    results = {}
+    try:
+        for count in thread_counts:
+            def worker(index):
+                user = HTTPUser(chatbot.app, base_url)
+                for i in range(requests_per_thread):
+                    user.send(messages[(index + i) % len(messages)])
+
+            seconds = run_threads(count, worker)
+            results[count] = count * requests_per_thread / seconds
+            print(f"throughput: {count:>3} threads {results[count]:>9.1f} requests/s")
+    finally:
+        server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--updates", type=int, default=10000, help="Q-value updates per thread")
+    parser.add_argument("--requests", type=int, default=200, help="HTTP requests per thread")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Switch threads as often as possible so that races show up within a short run
+    sys.setswitchinterval(1e-6)
+
+    # Run in a scratch directory so learned Q-values never touch the repository's q_values.json
+    workdir = tempfile.mkdtemp(prefix="chatbot-stress-")
+    shutil.copy(os.path.join(ROOT, "q_values.json"), workdir)
+    os.chdir(workdir)
+    import chatbot
+
+    most = max(args.threads)
+    results = {
+        "q_updates_ok": check_q_updates(chatbot, most, args.updates),
+        "session_ordering_ok": check_session_ordering(chatbot, most),
+        "throughput_rps": measure_throughput(chatbot, args.threads, args.requests),
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    chatbot.q_journal.close()
+    chatbot.q_contexts.close()
+    chatbot.conversation_log.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if not (results["q_updates_ok"] and results["session_ordering_ok"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,72 @@
-from flask import Flask, request, jsonify, render_template, session
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-import random
-import json
+import time
+
+# Measure how long importing this module takes (see startup_timings)
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, render_template, session
 import uuid
+import json
+import os
 import re
+import threading
+
+from contextual import ContextualQStore, context_key, sentiment_bucket
+from conversation_log import ConversationLog
+from dass21 import (band_matrix, cohort_stats, iter_csv, iter_json, parse_body, score_matrix,
+                    severity, subscale_of)
+from dialog import DialogEngine
+from faq import FAQEngine, FAQFile
+from lexicon import load_analyzer
+from message import Message
+from locks import KeyedLocks, StripedLocks
+from metrics import Counter, Gauge, Histogram, Registry, SamplingProfiler
+from persistence import QValueJournal, atomic_write_json, replay_q_values
+from profiles import ProfileStore
+from qsync import QValueSync
+from qtable import EpsilonGreedy, QTable
+from sentiment import SentimentService
+from sessions import create_session_backend, new_dass21_scores
 
 
-# Download VADER lexicon for sentiment analysis
-nltk.download('vader_lexicon')
-
 app = Flask(__name__)
 app.secret_key = "chatbot_secret_key"  # Required for session management
 
-sia = SentimentIntensityAnalyzer()
-
-# Track conversation state
-conversation_states = {}
+# Metrics exposed on /metrics
+metrics_registry = Registry()
+stage_seconds = metrics_registry.register(Histogram(
+    "chatbot_stage_seconds", "Time spent in each stage of a chat turn.", "stage"))
+turn_seconds = metrics_registry.register(Histogram(
+    "chatbot_turn_seconds", "Time to generate a reply, by dialog branch.", "branch"))
+q_value_updates = metrics_registry.register(Counter(
+    "chatbot_q_value_updates_total", "Q-value updates, by response table.", "table"))
+response_selections = metrics_registry.register(Counter(
+    "chatbot_response_selections_total", "Response selections, by exploration or exploitation.", "mode"))
+dass21_completions = metrics_registry.register(Counter(
+    "chatbot_dass21_completions_total", "Completed DASS-21 questionnaires."))
+
+# Sampling profiler that can be switched on at runtime (see /debug/profiler)
+profiler = SamplingProfiler()
+
+# Cached sentiment scoring. The VADER analyzer is created from the precompiled lexicon
+# (see lexicon.py) on first use, or up front by warm_up(); nothing is downloaded.
+sentiment = SentimentService(analyzer_factory=load_analyzer)
+metrics_registry.register(Gauge(
+    "chatbot_sentiment_cache_hits_total", "Sentiment cache hits.", lambda: sentiment.hits, kind="counter"))
+metrics_registry.register(Gauge(
+    "chatbot_sentiment_cache_misses_total", "Sentiment cache misses.", lambda: sentiment.misses, kind="counter"))
+
+# Track conversation state; idle sessions are evicted.
+# Set CHATBOT_SESSION_BACKEND=sqlite:///path/to/sessions.db to share sessions between worker processes.
+conversation_states = create_session_backend(os.environ.get("CHATBOT_SESSION_BACKEND", "memory"), idle_ttl=3600)
+
+# Turns of one session run one at a time, in the order they arrive; different sessions
+# run in parallel. (With the SQLite backend this orders turns within one process only.)
+session_locks = KeyedLocks()
+
+# Every turn of every conversation is written behind to append-only segments on disk
+conversation_log = ConversationLog(os.environ.get("CHATBOT_CONVERSATION_LOG", "conversations"))
+metrics_registry.register(Gauge(
+    "chatbot_active_sessions", "Live conversation sessions.", lambda: conversation_states.stats()["live_sessions"]))
 
 # DASS-21 Questionnaire setup
 dass21_questions = [
@@ -56,67 +106,67 @@ dass21_responses = [
 ]
 
 # Candidate responses for anxiety intervention help suggestions
-anxiety_responses = {
+anxiety_responses = QTable({
     "It seems you're feeling anxious. Have you tried deep breathing exercises?": 0.0,
     "Sometimes physical activity can help. A short walk or some light exercise might improve your mood.": 0.0,
     "Mindfulness meditation could be beneficial. Try focusing on your breath.": 0.0,
     "It might help to talk about what you're feeling. Consider reaching out to a friend or a professional for support.": 0.0,
     "Writing down your thoughts in a journal can be therapeutic and may help reduce anxiety.": 0.0
-}
+})
 
 # Follow-up responses for when someone says "no" to anxiety suggestions
-anxiety_followups = {
+anxiety_followups = QTable({
     "I understand. Deep breathing isn't for everyone. Would you like to try another approach? Perhaps talking about what's making you anxious might help.": 0.0,
     "That's okay. Sometimes it helps to identify what's triggering your anxiety. Can you share what's on your mind?": 0.0,
     "No problem. There are many ways to manage anxiety. Have you found anything that helps you feel calmer in the past?": 0.0,
     "I understand. Would you prefer to try mindfulness meditation instead? It can be helpful for managing anxiety.": 0.0,
     "That's alright. How about trying to focus on something positive? Is there something you're looking forward to?": 0.0
-}
+})
 
 # Adding positive responses for happy/good mood expressions
-positive_responses = {
+positive_responses = QTable({
     "That's wonderful to hear! It's great that you're feeling good today.": 0.0,
     "I'm so happy to hear that! What's contributing to your positive mood?": 0.0,
     "That's excellent! Positive feelings are worth celebrating. Keep it up!": 0.0,
     "Great to hear you're in a good mood! Is there anything specific that made your day better?": 0.0,
     "Fantastic! Happiness is contagious - thanks for sharing your positive energy!": 0.0
-}
+})
 
 # Adding responses for sad mood expressions
-sad_responses = {
+sad_responses = QTable({
     "I'm sorry to hear you're feeling sad. Would you like to talk about what's bothering you?": 0.0,
     "It's okay to feel sad sometimes. Is there anything I can do to support you?": 0.0,
     "I'm here for you. Sometimes sharing what's making you sad can help lighten the burden.": 0.0,
     "I understand. Sadness is a natural emotion. Is there something specific that's causing you to feel this way?": 0.0,
     "Thank you for sharing how you're feeling. Would talking about it help you feel better?": 0.0
-}
+})
 
 # Adding responses for stress expressions
-stress_responses = {
+stress_responses = QTable({
     "I can see you're feeling stressed. Taking a few moments to breathe deeply might help.": 0.0,
     "Stress can be challenging. Would you like to talk about what's causing it?": 0.0,
     "When you're feeling stressed, sometimes a short break can help. Could you step away for 5 minutes?": 0.0,
     "I understand stress can be difficult. Have you tried any relaxation techniques today?": 0.0,
     "Feeling stressed is common. Would it help to identify what's triggering your stress?": 0.0
-}
+})
 
 # Follow-up responses for stress suggestions
-stress_followups = {
+stress_followups = QTable({
     "I understand relaxation techniques don't work for everyone. Is there something specific causing your stress that you'd like to discuss?": 0.0,
     "That's okay. Sometimes identifying the source of stress can help manage it. What's been on your mind lately?": 0.0,
     "No problem. Everyone manages stress differently. What has helped you feel less stressed in the past?": 0.0,
     "I understand. Would it help to talk about ways to address the specific situation that's causing your stress?": 0.0,
     "That's alright. Sometimes just acknowledging stress is the first step. Is there anything else you'd like to talk about?": 0.0
-}
+})
 
 # General conversation responses for when no emotional state is detected
-general_conversation_responses = {
+general_conversation_responses = QTable({
     "What aspects of mental health are you most interested in discussing today?": 0.0,
     "Is there something specific about wellbeing or mental health you'd like to explore?": 0.0,
     "I'm here to chat about various topics related to mental wellness. What's on your mind?": 0.0,
     "I'd be happy to discuss coping strategies or mental health topics that interest you.": 0.0,
     "Everyone's mental health journey is unique. Is there something particular you're curious about?": 0.0
-}
+})
 
 # Common questions and their responses
 faq_responses = {
@@ -145,179 +195,305 @@ dass21_feedback_responses = {
     "normal_stress": "Your stress score is within the normal range."
 }
 
+# Other phrasings of the built-in FAQ questions
+faq_paraphrases = {
+    "what can you do": ["what do you do"],
+    "who made you": ["who created you", "who developed you", "who are you"],
+    "how does this work": ["how do this work", "how does you work", "how do you work", "how does it work",
+                           "how do it work"],
+    "what is dass21": ["what is dass", "depression test"]
+}
+
+# FAQ entries: the built-in ones plus those in faq.json (or CHATBOT_FAQ), which is
+# re-read when it changes
+faq = FAQFile(
+    FAQEngine(),
+    os.environ.get("CHATBOT_FAQ", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq.json")),
+    builtin={question: {"questions": [question] + faq_paraphrases.get(question, []), "answer": answer}
+             for question, answer in faq_responses.items()}
+)
+
+# Q-value tables by the name they are persisted under
+q_tables = {
+    "anxiety_responses": anxiety_responses,
+    "anxiety_followups": anxiety_followups,
+    "positive_responses": positive_responses,
+    "sad_responses": sad_responses,
+    "stress_responses": stress_responses,
+    "stress_followups": stress_followups,
+    "general_conversation_responses": general_conversation_responses
+}
+
+# Q-value updates are journaled in memory and written behind by a background thread
+q_journal = QValueJournal("q_values.json")
+
+def q_table_name(candidate_dict):
+    """Return the name a response dictionary is persisted under."""
+    for name, table in q_tables.items():
+        if table is candidate_dict:
+            return name
+    raise KeyError("unknown response table")
+
+# Each response table is read and updated under its stripe of these locks
+q_table_locks = StripedLocks(16)
+q_save_lock = threading.Lock()
+
 def save_q_values(filepath="q_values.json"):
-    """Save the response dictionaries (with Q-values) to a JSON file."""
-    data = {
-        "anxiety_responses": anxiety_responses,
-        "anxiety_followups": anxiety_followups,
-        "positive_responses": positive_responses,
-        "sad_responses": sad_responses,
-        "stress_responses": stress_responses,
-        "stress_followups": stress_followups,
-        "general_conversation_responses": general_conversation_responses
-    }
-    with open(filepath, "w") as f:
-        json.dump(data, f)
+    """Save the response dictionaries (with Q-values) to a JSON file, replacing it atomically."""
+    with q_save_lock:
+        data = {}
+        for name, table in q_tables.items():
+            with q_table_locks.lock_for(id(table)):
+                data[name] = dict(table)
+        atomic_write_json(filepath, data)
 
 def load_q_values(filepath="q_values.json"):
-    """Load the response dictionaries (with Q-values) from a JSON file, if available."""
-    global anxiety_responses, anxiety_followups, positive_responses, sad_responses, stress_responses, stress_followups, general_conversation_responses
-    try:
-        with open(filepath, "r") as f:
-            data = json.load(f)
-            anxiety_responses.update(data.get("anxiety_responses", {}))
-            anxiety_followups.update(data.get("anxiety_followups", {}))
-            positive_responses.update(data.get("positive_responses", {}))
-            sad_responses.update(data.get("sad_responses", {}))
-            stress_responses.update(data.get("stress_responses", {}))
-            stress_followups.update(data.get("stress_followups", {}))
-            general_conversation_responses.update(data.get("general_conversation_responses", {}))
-    except FileNotFoundError:
-        pass
+    """Load the response dictionaries (with Q-values) from the JSON snapshot and its delta log, if available."""
+    if filepath == q_journal.filepath:
+        q_journal.load(q_tables)
+    else:
+        replay_q_values(filepath, q_tables)
 
 # Load saved Q-values at startup, if any
 load_q_values()
 
-def select_response(candidate_dict):
+# Alternative response pools and Q-values ("profiles", e.g. per clinic or language),
+# memory-mapped from CHATBOT_PROFILES/<name>/ when a session first uses them
+profile_store = ProfileStore(os.environ.get("CHATBOT_PROFILES", "profiles"), locks=q_table_locks)
+metrics_registry.register(Gauge(
+    "chatbot_loaded_profiles", "Bot profiles loaded in this process.", lambda: profile_store.stats()["loaded"]))
+
+# With several worker processes, set CHATBOT_Q_SYNC=path/to/q_values.db so that every
+# worker's updates are merged into one shared table instead of overwriting q_values.json
+q_sync = None
+if os.environ.get("CHATBOT_Q_SYNC"):
+    q_sync = QValueSync(os.environ["CHATBOT_Q_SYNC"], locks=q_table_locks)
+    q_sync.load(q_tables)
+
+# Q-values of the default tables per dialog context (last question type, consecutive
+# default replies, sentiment), in q_values.contexts.npz (or CHATBOT_Q_CONTEXTS); contexts
+# with little data fall back to the context-free values above. They are learned per
+# process like q_values.json, so they are not used when CHATBOT_Q_SYNC pools learning.
+use_q_contexts = q_sync is None
+q_contexts = ContextualQStore(q_tables, os.environ.get("CHATBOT_Q_CONTEXTS", "q_values.contexts.npz"),
+                              locks=q_table_locks)
+if use_q_contexts:
+    q_contexts.load()
+
+# Response selection policy; Softmax and UCB1 from qtable can be used instead
+response_policy = EpsilonGreedy(epsilon=0.1)  # 10% chance to explore randomly
+
+def select_response(candidate_dict, context=None):
     """
-    Select a candidate response using an epsilon-greedy strategy.
+    Select a candidate response using the response policy (epsilon-greedy by default).
     With probability epsilon, choose a random response (exploration);
     otherwise, choose the response with the highest Q-value (exploitation).
+    Pass a context key (see contextual.context_key) to rank a default table's
+    responses by their Q-values in that context.
     """
-    epsilon = 0.1  # 10% chance to explore randomly
-    if random.random() < epsilon:
-        return random.choice(list(candidate_dict.keys()))
-    else:
-        return max(candidate_dict, key=candidate_dict.get)
-
-def update_q_value(candidate_dict, response, reward, learning_rate=0.1):
+    with q_table_locks.lock_for(id(candidate_dict)):
+        if context is not None:
+            candidate_dict = q_contexts[q_table_name(candidate_dict)].view(context)
+        response, explored = candidate_dict.select(response_policy)
+    response_selections.inc("explore" if explored else "exploit")
+    return response
+
+def update_q_value(candidate_dict, response, reward, learning_rate=0.1, profile=None, context=None):
     """
     Update the Q-value for the selected response based on the reward.
     Q_new = Q_old + learning_rate * (reward - Q_old)
+    Pass the Profile that `candidate_dict` belongs to for profile tables, and the
+    context key the response was selected in to learn its contextual Q-value too.
+    """
+    with stage_seconds.time("q_update"), q_table_locks.lock_for(id(candidate_dict)):
+        if profile is not None:
+            # Written back to the profile's file by profile_store
+            name = profile.table_name(candidate_dict)
+            profile.learn(name, response, reward, learning_rate)
+        else:
+            # Journaled under the same lock, so the last record for a response is its current value
+            name = q_table_name(candidate_dict)
+            new_value = candidate_dict.learn(response, reward, learning_rate)
+            if context is not None:
+                q_contexts.learn(name, context, response, reward, learning_rate)
+            if q_sync is not None:
+                q_sync.record(name, response, reward)  # Merged into the shared table
+            else:
+                q_journal.record(name, response, new_value)  # Persisted in the background
+    q_value_updates.inc(name)
+
+def credit_previous_reply(state, reward):
+    """
+    Learn `reward`, from the user's reaction, for the pool response the bot sent in
+    its previous reply, in the context it was selected in (see state.pending_credit).
     """
-    candidate_dict[response] = candidate_dict[response] + learning_rate * (reward - candidate_dict[response])
-    save_q_values()  # Save updated Q-values to file
+    profile_name, pool, response, context = state.pending_credit
+    state.pending_credit = None
+    if profile_name is not None:
+        profile = profile_store.get(profile_name)
+        table = profile.tables.get(pool) if profile is not None else None
+    else:
+        profile, table = None, q_tables.get(pool)
+    # The profile or pool may have gone away since
+    if table is not None and response in table:
+        update_q_value(table, response, reward, profile=profile, context=context)
 
 def contains_anxiety_keywords(user_input):
     """
     Check if the user input contains any anxiety-related keywords.
     """
-    anxiety_keywords = ["anxiety", "anxious", "nervous", "panic", "worried", "fear", "tense", "worry", "afraid", 
-                        "uneasy", "apprehensive", "frightened", "scared"]
-    user_input_lower = user_input.lower()
-    return any(keyword in user_input_lower for keyword in anxiety_keywords)
+    return "anxiety" in dialog_engine.current.intents(user_input)
 
 def contains_stress_keywords(user_input):
     """
     Check if the user input contains stress-related keywords.
     """
-    stress_keywords = ["stress", "stressed", "stressful", "pressure", "overwhelm", "overwhelmed", 
-                      "burnt out", "burnout", "tension", "exhausted", "overworked", "too much"]
-    user_input_lower = user_input.lower()
-    return any(keyword in user_input_lower for keyword in stress_keywords)
+    return "stress" in dialog_engine.current.intents(user_input)
 
 def contains_positive_keywords(user_input):
     """
     Check if the user input contains positive mood keywords.
     """
-    positive_keywords = ["happy", "good mood", "great", "excellent", "wonderful", "joyful", "fantastic", 
-                         "feeling good", "feeling better", "cheerful", "positive", "upbeat", "content"]
-    user_input_lower = user_input.lower()
-    return any(keyword in user_input_lower for keyword in positive_keywords)
+    return "positive" in dialog_engine.current.intents(user_input)
 
 def contains_sad_keywords(user_input):
     """
     Check if the user input contains sad mood keywords.
     """
-    sad_keywords = ["sad", "unhappy", "depressed", "down", "blue", "miserable", "upset", 
-                    "gloomy", "heartbroken", "disappointed", "sorrowful", "hurt"]
-    user_input_lower = user_input.lower()
-    return any(keyword in user_input_lower for keyword in sad_keywords)
+    return "sad" in dialog_engine.current.intents(user_input)
 
 def contains_negative_response(user_input):
     """
     Check if the user input contains negative responses like "no".
     """
-    negative_responses = ["no", "nope", "don't want to", "not really", "not interested", "haven't"]
-    user_input_lower = user_input.lower()
-    return any(response in user_input_lower for response in negative_responses)
+    return "negative" in dialog_engine.current.intents(user_input)
 
 def contains_dass21_command(user_input):
     """
     Check if the user input contains a request to take the DASS-21 test.
     """
-    dass21_keywords = ["dass", "dass21", "dass-21", "depression test", "anxiety test", "stress test", 
-                       "mental health test", "assessment", "questionnaire", "test me"]
-    user_input_lower = user_input.lower()
-    return any(keyword in user_input_lower for keyword in dass21_keywords)
+    return "dass21" in dialog_engine.current.intents(user_input)
+
+def intent_pool(user_input):
+    """
+    Return the name of the response pool chat() would answer the input from outside
+    any conversation, or None when that depends on the conversation state (follow-ups
+    and fallbacks) or the answer does not come from a pool.
+    """
+    message = Message(user_input, message_features)
+    if "negative" in message.intents:
+        return None
+    action, _ = dialog_engine.current.route(message, None, intents=message.intents)
+    return action.pool if action.min_consecutive_defaults == 0 else None
 
 def check_for_faq(user_input):
     """
     Check if the user input matches any FAQ and return the appropriate response.
     """
-    user_input_lower = user_input.lower()
-    
-    # Check for exact matches first
-    for question, answer in faq_responses.items():
-        if question in user_input_lower:
-            return answer
-    
-    # Check for question types
-    if re.search(r"what (can|do) you do", user_input_lower) or re.search(r"how (can|do) you help", user_input_lower):
-        return faq_responses["what can you do"]
-    
-    if re.search(r"who (made|created|developed) you", user_input_lower) or "who are you" in user_input_lower:
-        return faq_responses["who made you"]
-    
-    if re.search(r"how (does|do) (this|you|it) work", user_input_lower):
-        return faq_responses["how does this work"]
-    
-    if re.search(r"what is (dass|dass21|dass-21)", user_input_lower) or "depression test" in user_input_lower:
-        return faq_responses["what is dass21"]
-    
-    # No FAQ match found
-    return None
+    return faq.lookup(user_input)
 
 def interpret_dass21_scores(depression_score, anxiety_score, stress_score):
     """
     Interpret DASS-21 scores based on standard severity ratings.
     Returns a tuple of (depression_level, anxiety_level, stress_level)
     """
-    # Depression interpretation (multiply by 2 to match full DASS-42 scale)
-    depression_score *= 2
-    if depression_score >= 28:
-        depression_level = "high_depression"
-    elif depression_score >= 20:
-        depression_level = "moderate_depression"
-    elif depression_score >= 10:
-        depression_level = "mild_depression"
-    else:
-        depression_level = "normal_depression"
-    
-    # Anxiety interpretation (multiply by 2 to match full DASS-42 scale)
-    anxiety_score *= 2
-    if anxiety_score >= 20:
-        anxiety_level = "high_anxiety"
-    elif anxiety_score >= 14:
-        anxiety_level = "moderate_anxiety"
-    elif anxiety_score >= 8:
-        anxiety_level = "mild_anxiety"
-    else:
-        anxiety_level = "normal_anxiety"
-    
-    # Stress interpretation (multiply by 2 to match full DASS-42 scale)
-    stress_score *= 2
-    if stress_score >= 34:
-        stress_level = "high_stress"
-    elif stress_score >= 26:
-        stress_level = "moderate_stress"
-    elif stress_score >= 18:
-        stress_level = "mild_stress"
-    else:
-        stress_level = "normal_stress"
+    # The bands are defined on the full DASS-42 scale (scores multiplied by 2)
+    depression_level = severity("depression", depression_score)
+    anxiety_level = severity("anxiety", anxiety_score)
+    stress_level = severity("stress", stress_score)
     
     return depression_level, anxiety_level, stress_level
 
+def sentiment_reward(message):
+    """
+    Message feature: the message's sentiment as a reward for the bot's previous
+    reply, which the message reacts to: 1 if positive, -1 if negative, 0 if neutral.
+    """
+    return sentiment_bucket(message.sentiment["compound"])
+
+def sentiment_scores(message):
+    """Message feature: VADER polarity scores of the message."""
+    with stage_seconds.time("sentiment"):
+        return sentiment.score(message.text)
+
+# Lowercased DASS-21 options, and other words accepted as answers
+_digit = re.compile(r"\d")
+dass21_response_options = [response.lower() for response in dass21_responses]
+dass21_answer_words = {
+    "not at all": 0, "never": 0, "none": 0,
+    "somewhat": 1, "sometimes": 1, "some": 1,
+    "considerable": 2, "often": 2, "good part": 2,
+    "very much": 3, "always": 3, "most of the time": 3
+}
+
+def parse_dass21_answer(message):
+    """
+    Message feature: the message as a DASS-21 answer, a number or part of an option's
+    wording. Numbers outside 0-3 are returned as they are; None if it is no answer.
+    """
+    # Every number int() accepts has a decimal digit; skip the exception for the rest
+    if _digit.search(message.text):
+        try:
+            return int(message.text)
+        except ValueError:
+            pass
+    lower = message.lower
+    for i, option in enumerate(dass21_response_options):
+        if lower in option:
+            return i
+    return dass21_answer_words.get(lower)
+
+def detect_intents(message):
+    """Message feature: the intents of the message in the current dialog definition."""
+    with stage_seconds.time("intent_matching"):
+        return dialog_engine.current.intents(message.text, message.lower)
+
+def start_dass21(state, message, detected):
+    """Dialog handler: start the DASS-21 questionnaire and return its introduction."""
+    state.in_dass21 = True
+    state.dass21_question_index = 0
+    state.dass21_scores = new_dass21_scores()
+    
+    intro = "I'll help you take the DASS-21 questionnaire, which measures depression, anxiety, and stress symptoms. It has 21 questions that refer to how you've been feeling during the past week.\n\n"
+    intro += "For each statement, please rate on a scale of 0-3 how much it applied to you:\n"
+    intro += "0 = Did not apply to me at all\n"
+    intro += "1 = Applied to me to some degree, or some of the time\n"
+    intro += "2 = Applied to me to a considerable degree, or a good part of time\n"
+    intro += "3 = Applied to me very much, or most of the time\n\n"
+    intro += f"Question 1/{len(dass21_questions)}: {dass21_questions[0]}"
+    return intro
+
+def answer_faq(state, message, detected):
+    """Dialog handler: reply with the FAQ answer found by the faq detector."""
+    return detected
+
+def faq_answer(message):
+    """Message feature: the FAQ answer for the message, or None."""
+    with stage_seconds.time("faq"):
+        return faq.lookup(message.text, message.tokens)
+
+def detect_faq(message):
+    return message.faq
+
+# Handlers and detectors that dialog.json can refer to by name
+dialog_handlers = {"start_dass21": start_dass21, "faq": answer_faq}
+dialog_detectors = {"faq": detect_faq}
+
+# Features of a user message, computed when a stage first reads them (see message.py)
+message_features = {
+    "intents": detect_intents,
+    "faq": faq_answer,
+    "dass21_answer": parse_dass21_answer,
+    "sentiment": sentiment_scores,
+    "reward": sentiment_reward
+}
+
+# Intents, routes and fallbacks of the dialog, reloaded when dialog.json changes
+dialog_engine = DialogEngine(
+    os.environ.get("CHATBOT_DIALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dialog.json")),
+    pools=q_tables, handlers=dialog_handlers, detectors=dialog_detectors, features=message_features
+)
+
 @app.route("/")
 def home():
     # Generate a session ID if it doesn't exist
@@ -325,114 +501,217 @@ def home():
         session["session_id"] = str(uuid.uuid4())
     
     # Initialize conversation state for this session
-    if session["session_id"] not in conversation_states:
-        conversation_states[session["session_id"]] = {
-            "last_question_type": None,
-            "last_response": None,
-            "in_dass21": False,
-            "dass21_question_index": 0,
-            "dass21_scores": {
-                "depression": 0,
-                "anxiety": 0,
-                "stress": 0
-            },
-            "consecutive_default_responses": 0,
-            "conversation_history": []
-        }
+    conversation_states.save(session["session_id"], conversation_states.load(session["session_id"]))
     
     return render_template("index.html")
 
+# Request validation shared by this app and asgi.py. Each helper takes the raw request
+# body and raises ValueError with the message of a 400 response.
+
+def parse_json_body(body):
+    """Return the JSON value of a request body, or None if it is not valid JSON."""
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+def chat_request(body):
+    """Validate a /chat request body and return (message, profile name or None)."""
+    data = parse_json_body(body)
+    if not isinstance(data, dict) or not isinstance(data.get("message", ""), str):
+        raise ValueError("Expected a JSON object with a message")
+    profile = data.get("profile")
+    if profile is not None and not profile_store.exists(profile):
+        raise ValueError(f"Unknown profile {profile!r}")
+    return data.get("message", "").strip(), profile
+
 @app.route("/chat", methods=["POST"])
 def chat():
-    data = request.get_json()
-    user_input = data.get("message", "").strip()
+    try:
+        user_input, profile = chat_request(request.get_data())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Get or create session ID
     session_id = session.get("session_id", str(uuid.uuid4()))
     if "session_id" not in session:
         session["session_id"] = session_id
     
-    # Get or initialize conversation state
-    if session_id not in conversation_states:
-        conversation_states[session_id] = {
-            "last_question_type": None,
-            "last_response": None,
-            "in_dass21": False,
-            "dass21_question_index": 0,
-            "dass21_scores": {
-                "depression": 0,
-                "anxiety": 0,
-                "stress": 0
-            },
-            "consecutive_default_responses": 0,
-            "conversation_history": []
-        }
+    return jsonify({"response": chat_turn(session_id, user_input, profile)})
+
+def chat_turn(session_id, user_input, profile=None):
+    """
+    Run one turn for a session and return the reply. The state is loaded once and
+    written back once the reply is ready, with the session's lock held throughout.
+    """
+    with session_locks.hold(session_id):
+        state = conversation_states.load(session_id)
+        if profile is not None:
+            state.profile = profile
+        response = generate_response(state, user_input, session_id)
+        conversation_states.save(session_id, state)
+    return response
+
+# Largest number of messages accepted by /chat/batch in one request
+MAX_BATCH_SIZE = 1000
+# Session IDs are stored with a 16-bit length in the conversation log
+MAX_SESSION_ID_LENGTH = 256
+
+def chat_batch_request(body, default_session_id):
+    """
+    Validate a /chat/batch request body and return its (session_id, message) turns;
+    items without a session_id get `default_session_id`.
+    """
+    data = parse_json_body(body)
+    items = data.get("messages") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("Expected {\"messages\": [{\"session_id\": ..., \"message\": ...}]}")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} messages per batch")
+    turns = [(str(item.get("session_id") or default_session_id), str(item.get("message", "")).strip())
+             for item in items]
+    if any(len(session_id.encode("utf-8")) > MAX_SESSION_ID_LENGTH for session_id, _ in turns):
+        raise ValueError(f"session_id longer than {MAX_SESSION_ID_LENGTH} bytes")
+    return turns
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """
+    Process many messages in one request. Expects {"messages": [{"session_id", "message"}, ...]}
+    and returns {"responses": [{"session_id", "response"}, ...]} in the same order.
+    Items without a session_id belong to the caller's own session.
+    """
+    default_session_id = session.get("session_id", str(uuid.uuid4()))
+    try:
+        turns = chat_batch_request(request.get_data(), default_session_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "session_id" not in session:
+        session["session_id"] = default_session_id
     
-    state = conversation_states[session_id]
+    responses = generate_responses(turns)
+    return jsonify({"responses": [{"session_id": session_id, "response": response}
+                                  for (session_id, _), response in zip(turns, responses)]})
+
+MAX_DASS21_BULK_SIZE = 100000
+DASS21_BULK_FORMATS = ("json", "csv", "cohort")
+
+def dass21_bulk_request(body, content_type, output):
+    """
+    Validate a /dass21/bulk request (its body, content type and ?format) and return
+    the (ids, scores, bands) of its respondents.
+    """
+    if output not in DASS21_BULK_FORMATS:
+        raise ValueError("format must be json, csv or cohort")
+    ids, answers = parse_body(body, content_type)
+    if len(answers) > MAX_DASS21_BULK_SIZE:
+        raise ValueError(f"At most {MAX_DASS21_BULK_SIZE} respondents per request")
+    scores = score_matrix(answers)
+    return ids, scores, band_matrix(scores)
+
+@app.route("/dass21/bulk", methods=["POST"])
+def dass21_bulk():
+    """
+    Score many completed DASS-21 questionnaires at once. Accepts JSON
+    {"responses": [[21 answers], ...]} (or {"id": ..., "answers": [...]} items) or a
+    text/csv body with one respondent per row. Streams per-respondent scores and
+    severity levels as JSON, followed by cohort statistics; ?format=csv streams the
+    results as CSV and ?format=cohort returns only the cohort statistics.
+    """
+    output = request.args.get("format", "json")
+    try:
+        ids, scores, bands = dass21_bulk_request(request.get_data(), request.mimetype, output)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if output == "cohort":
+        return jsonify(cohort_stats(scores, bands))
+    if output == "csv":
+        return Response(iter_csv(ids, scores, bands), mimetype="text/csv")
+    return Response(iter_json(ids, scores, bands), mimetype="application/json")
+
+def generate_responses(turns):
+    """
+    Run a batch of (session_id, message) turns and return the replies in input order.
+    Messages of one session are processed in their original order, each session's state
+    is loaded and saved once, and all messages are sentiment-scored in one batch call.
+    The resulting Q-value updates reach disk together through the write-behind journal.
+    """
+    # Score every distinct message once up front; generate_response then hits the cache
+    sentiment.score_batch([message for _, message in turns])
+    
+    indexes_by_session = {}
+    for index, (session_id, _) in enumerate(turns):
+        indexes_by_session.setdefault(session_id, []).append(index)
+    
+    responses = [None] * len(turns)
+    for session_id, indexes in indexes_by_session.items():
+        with session_locks.hold(session_id):
+            state = conversation_states.load(session_id)
+            for index in indexes:
+                responses[index] = generate_response(state, turns[index][1], session_id)
+            conversation_states.save(session_id, state)
+    return responses
+
+def generate_response(state, user_input, session_id):
+    """
+    Run one turn of the dialog: update the session state for the user's message
+    and return the bot's reply. Both are written to the conversation log.
+    """
+    started = time.perf_counter()
+    was_in_dass21 = state.in_dass21
+    conversation_log.append(session_id, "user", user_input)
+    response = dialog_turn(state, user_input)
+    conversation_log.append(session_id, "bot", response)
+    if was_in_dass21 or state.in_dass21:
+        branch = "dass21"
+        if was_in_dass21 and not state.in_dass21:
+            dass21_completions.inc()
+    else:
+        branch = str(state.last_question_type)
+    turn_seconds.observe(time.perf_counter() - started, branch)
+    return response
+
+def dialog_turn(state, user_input):
+    """The dialog logic behind generate_response."""
+    # Each feature of the message is computed once, by the first stage that needs it
+    message = Message(user_input, message_features)
     
-    # Record this message in conversation history
-    state["conversation_history"].append({"role": "user", "content": user_input})
+    # The message is the user's reaction to the previous reply: learn from its sentiment
+    if state.pending_credit is not None:
+        credit_previous_reply(state, message.reward)
     
     # Handle DASS-21 questionnaire
-    if state["in_dass21"]:
-        # Try to process the answer as a number (0-3) or text matching the options
-        answer = -1
-        try:
-            # Try to parse as number first
-            answer = int(user_input)
-            if answer < 0 or answer > 3:
-                response = "Please enter a number between 0 and 3, where:\n0 = Did not apply to me at all\n1 = Applied to me to some degree\n2 = Applied to me considerably\n3 = Applied to me very much"
-                state["conversation_history"].append({"role": "bot", "content": response})
-                return jsonify({"response": response})
-        except ValueError:
-            # Try to match to response options
-            user_input_lower = user_input.lower()
-            for i, response in enumerate(dass21_responses):
-                if user_input_lower in response.lower():
-                    answer = i
-                    break
-            
-            # If still not matched, handle simple cases
-            if answer == -1:
-                if user_input_lower in ["0", "not at all", "never", "none"]:
-                    answer = 0
-                elif user_input_lower in ["1", "somewhat", "sometimes", "some"]:
-                    answer = 1
-                elif user_input_lower in ["2", "considerable", "often", "good part"]:
-                    answer = 2
-                elif user_input_lower in ["3", "very much", "always", "most of the time"]:
-                    answer = 3
+    if state.in_dass21:
+        # Process the answer as a number (0-3) or text matching the options
+        answer = message.dass21_answer
         
         # If we couldn't parse the answer, ask again
-        if answer == -1:
+        if answer is None:
             response = "I didn't understand your response. Please enter a number between 0-3:\n0 = Did not apply to me at all\n1 = Applied to me to some degree\n2 = Applied to me considerably\n3 = Applied to me very much"
-            state["conversation_history"].append({"role": "bot", "content": response})
-            return jsonify({"response": response})
+            return response
+        if answer < 0 or answer > 3:
+            response = "Please enter a number between 0 and 3, where:\n0 = Did not apply to me at all\n1 = Applied to me to some degree\n2 = Applied to me considerably\n3 = Applied to me very much"
+            return response
         
         # Record the score in the appropriate category
-        question_index = state["dass21_question_index"]
-        if question_index < 7:
-            state["dass21_scores"]["depression"] += answer
-        elif question_index < 14:
-            state["dass21_scores"]["anxiety"] += answer
-        else:
-            state["dass21_scores"]["stress"] += answer
+        question_index = state.dass21_question_index
+        state.dass21_scores[subscale_of(question_index)] += answer
         
         # Move to the next question or finish the questionnaire
-        state["dass21_question_index"] += 1
-        if state["dass21_question_index"] < len(dass21_questions):
+        state.dass21_question_index += 1
+        if state.dass21_question_index < len(dass21_questions):
             # Still have more questions
-            question_num = state["dass21_question_index"] + 1
-            question = dass21_questions[state["dass21_question_index"]]
+            question_num = state.dass21_question_index + 1
+            question = dass21_questions[state.dass21_question_index]
             response = f"Question {question_num}/{len(dass21_questions)}: {question}\n\nPlease rate on a scale of 0-3 how much this applied to you in the past week:\n0 = Did not apply to me at all\n1 = Applied to me to some degree\n2 = Applied to me considerably\n3 = Applied to me very much"
-            state["conversation_history"].append({"role": "bot", "content": response})
-            return jsonify({"response": response})
+            return response
         else:
             # Questionnaire completed
-            state["in_dass21"] = False
-            depression_score = state["dass21_scores"]["depression"]
-            anxiety_score = state["dass21_scores"]["anxiety"]
-            stress_score = state["dass21_scores"]["stress"]
+            state.in_dass21 = False
+            depression_score = state.dass21_scores["depression"]
+            anxiety_score = state.dass21_scores["anxiety"]
+            stress_score = state.dass21_scores["stress"]
             
             # Interpret scores
             depression_level, anxiety_level, stress_level = interpret_dass21_scores(
@@ -440,8 +719,8 @@ def chat():
             )
             
             # Reset for next time
-            state["dass21_question_index"] = 0
-            state["dass21_scores"] = {"depression": 0, "anxiety": 0, "stress": 0}
+            state.dass21_question_index = 0
+            state.dass21_scores = new_dass21_scores()
             
             # Provide feedback
             feedback = f"Thank you for completing the DASS-21 questionnaire. Here are your results:\n\n"
@@ -450,130 +729,83 @@ def chat():
             feedback += f"Stress score: {stress_score*2}/42\n{dass21_feedback_responses[stress_level]}\n\n"
             feedback += "Remember, this is not a clinical diagnosis. If you're concerned about your mental health, please speak with a qualified mental health professional."
             
-            state["conversation_history"].append({"role": "bot", "content": feedback})
-            return jsonify({"response": feedback})
-    
-    # Check if user wants to start DASS-21
-    if contains_dass21_command(user_input):
-        state["in_dass21"] = True
-        state["dass21_question_index"] = 0
-        state["dass21_scores"] = {"depression": 0, "anxiety": 0, "stress": 0}
-        state["consecutive_default_responses"] = 0
-        
-        intro = "I'll help you take the DASS-21 questionnaire, which measures depression, anxiety, and stress symptoms. It has 21 questions that refer to how you've been feeling during the past week.\n\n"
-        intro += "For each statement, please rate on a scale of 0-3 how much it applied to you:\n"
-        intro += "0 = Did not apply to me at all\n"
-        intro += "1 = Applied to me to some degree, or some of the time\n"
-        intro += "2 = Applied to me to a considerable degree, or a good part of time\n"
-        intro += "3 = Applied to me very much, or most of the time\n\n"
-        intro += f"Question 1/{len(dass21_questions)}: {dass21_questions[0]}"
-        
-        state["conversation_history"].append({"role": "bot", "content": intro})
-        return jsonify({"response": intro})
-    
-    # Check if the input matches any FAQ
-    faq_response = check_for_faq(user_input)
-    if faq_response:
-        state["consecutive_default_responses"] = 0
-        state["last_question_type"] = "faq"
-        state["conversation_history"].append({"role": "bot", "content": faq_response})
-        return jsonify({"response": faq_response})
-    
-    # Analyze sentiment for reward calculation
-    sentiment_scores = sia.polarity_scores(user_input)
-    compound = sentiment_scores['compound']
-    
-    # Define reward based on sentiment
-    if compound >= 0.05:
-        reward = 1
-    elif compound <= -0.05:
-        reward = -1
+            return feedback
+    
+    # Detect every intent in the message with a single scan, then look up the
+    # highest-priority route for them in the current dialog state
+    dialog = dialog_engine.get()
+    action, detected = dialog.route(message, state.last_question_type,
+                                    state.consecutive_default_responses, message.intents)
+    
+    if action.handler is not None:
+        response = dialog_handlers[action.handler](state, message, detected)
+    elif action.pool is not None:
+        profile = profile_store.get(state.profile) if state.profile is not None else None
+        # Pools a profile does not define come from the default tables
+        if profile is not None and action.pool in profile.tables:
+            table, context = profile.tables[action.pool], None
+        else:
+            table, profile = q_tables[action.pool], None
+            # Select by what is known before replying, including this message's sentiment
+            context = (context_key(state.last_question_type, state.consecutive_default_responses, message.reward)
+                       if use_q_contexts else None)
+        response = select_response(table, context)
+        # Learned from the sentiment of the user's next message, their reaction to it
+        state.pending_credit = [profile.name if profile is not None else None, action.pool, response, context]
+        state.last_response = response
     else:
-        reward = 0
-    
-    # Handle follow-up responses based on previous question type
-    if state["last_question_type"] == "anxiety" and contains_negative_response(user_input):
-        selected_response = select_response(anxiety_followups)
-        update_q_value(anxiety_followups, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "anxiety_followup"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    # Handle stress follow-ups
-    if state["last_question_type"] == "stress" and contains_negative_response(user_input):
-        selected_response = select_response(stress_followups)
-        update_q_value(stress_followups, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "stress_followup"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    # Basic greeting response
-    user_input_lower = user_input.lower()
-    greetings = ["hi", "hello", "hey"]
-    if any(greeting == user_input_lower for greeting in greetings):
-        response = "Hi, how are you? I'm here to help. How are you feeling today? If you'd like to take the DASS-21 questionnaire to assess depression, anxiety, and stress, just type 'DASS-21'."
-        state["last_question_type"] = "greeting"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": response})
-        return jsonify({"response": response})
+        response = action.reply
     
-    # Handle emotion-specific responses
-    if contains_positive_keywords(user_input):
-        selected_response = select_response(positive_responses)
-        update_q_value(positive_responses, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "positive"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    elif contains_sad_keywords(user_input):
-        selected_response = select_response(sad_responses)
-        update_q_value(sad_responses, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "sad"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    elif contains_anxiety_keywords(user_input):
-        selected_response = select_response(anxiety_responses)
-        update_q_value(anxiety_responses, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "anxiety"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    elif contains_stress_keywords(user_input):
-        selected_response = select_response(stress_responses)
-        update_q_value(stress_responses, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "stress"
-        state["consecutive_default_responses"] = 0
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
-    
-    # If we've already given the default response multiple times, try a different approach
-    if state["consecutive_default_responses"] >= 2:
-        selected_response = select_response(general_conversation_responses)
-        update_q_value(general_conversation_responses, selected_response, reward)
-        state["last_response"] = selected_response
-        state["last_question_type"] = "general"
-        state["consecutive_default_responses"] += 1
-        state["conversation_history"].append({"role": "bot", "content": selected_response})
-        return jsonify({"response": selected_response})
+    if action.next_state is not None:
+        state.last_question_type = action.next_state
+    if action.counts_as_default:
+        state.consecutive_default_responses += 1
     else:
-        # Default response if no specific emotion is detected
-        response = "I'm here to support you. How are you feeling today? Whether you're having a great day or facing some challenges, I'm here to chat. You can also take the DASS-21 questionnaire by typing 'DASS-21'."
-        state["last_question_type"] = "default"
-        state["consecutive_default_responses"] += 1
-        state["conversation_history"].append({"role": "bot", "content": response})
-        return jsonify({"response": response})
+        state.consecutive_default_responses = 0
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Expose the metrics in the Prometheus text format."""
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/debug/profiler", methods=["GET", "POST"])
+def profiler_endpoint():
+    """
+    Control the sampling profiler: POST {"action": "start"} or {"action": "stop"},
+    GET for the collected stacks in folded format. Only available with CHATBOT_PROFILER=1.
+    """
+    if os.environ.get("CHATBOT_PROFILER") != "1":
+        return jsonify({"error": "Not found"}), 404
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        action = data.get("action") if isinstance(data, dict) else None
+        if action == "start":
+            profiler.start()
+        elif action == "stop":
+            profiler.stop()
+        else:
+            return jsonify({"error": "action must be start or stop"}), 400
+        return jsonify({"running": profiler.running})
+    return Response(profiler.folded(), mimetype="text/plain")
+
+# Seconds spent in each startup step
+startup_timings = {"import": time.perf_counter() - _import_started}
+
+def warm_up():
+    """
+    Create the heavy objects ahead of the first request and return startup_timings.
+    Call this in the pre-fork master (e.g. gunicorn --preload, which imports this module
+    there) so forked workers share the analyzer copy-on-write.
+    """
+    started = time.perf_counter()
+    sentiment.analyzer
+    startup_timings["warm_up"] = time.perf_counter() - started
+    app.logger.info("Startup: import %.3fs, warm-up %.3fs", startup_timings["import"], startup_timings["warm_up"])
+    return startup_timings
+
+if os.environ.get("CHATBOT_PRELOAD", "1") == "1":
+    warm_up()
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Contextual Q-values: response values conditioned on the dialog context.
+
+A context is (last question type, consecutive default replies capped at 3, sentiment
+bucket of the user's message). Contexts are stored sparsely: each is hashed to a
+stable 64-bit integer key, and a row of Q-values and visit counts is allocated in a
+2-D array only when a response is first learned in that context. Estimates shrink
+towards the context-free Q-value of the response while a context has few visits, and
+contexts never seen use the context-free values directly.
+
+Existing deployments need no conversion: without a contexts file every context falls
+back to the context-free values in q_values.json, which are still learned and saved as
+before, and rows fill in as traffic arrives. To inspect a contexts file:
+    python contextual.py q_values.contexts.npz
+"""
+import atexit
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from locks import StripedLocks
+from persistence import PeriodicWorker
+
+MAX_DEFAULTS = 3
+
+
+def sentiment_bucket(compound, positive_threshold=0.05, negative_threshold=-0.05):
+    """-1, 0 or 1 for a VADER compound score, with the same cut-offs as the reward."""
+    if compound >= positive_threshold:
+        return 1
+    elif compound <= negative_threshold:
+        return -1
+    return 0
+
+
+def context_key(last_question_type, consecutive_defaults, bucket):
+    """Return the stable 64-bit key of a dialog context (the same in every process)."""
+    text = f"{last_question_type}|{min(consecutive_defaults, MAX_DEFAULTS)}|{bucket}"
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class ContextView:
+    """A QTable-like view of one table's estimates in one context, for the selection policies."""
+
+    def __init__(self, table, values, counts):
+        self.texts = table.texts
+        self.ids = table.ids
+        self._values = values
+        self._counts = counts
+
+    def active_values(self):
+        return self._values
+
+    def active_counts(self):
+        return self._counts
+
+    def best(self):
+        return int(np.argmax(self._values))
+
+    def select(self, policy):
+        response_id, explored = policy.choose(self)
+        return self.texts[response_id], explored
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class ContextualQTable:
+    """
+    Sparse per-context Q-values for the responses of one QTable (the context-free
+    `base`). While a context has n visits to a response, its estimate is
+    (n * Q_context + prior_strength * Q_base) / (n + prior_strength).
+    """
+
+    def __init__(self, base, prior_strength=5.0, capacity=16):
+        self.base = base
+        self.prior_strength = prior_strength
+        self.rows = {}
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.values = np.zeros((capacity, max(len(base), 1)))
+        self.counts = np.zeros((capacity, max(len(base), 1)), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _ensure_width(self):
+        width = len(self.base)
+        if width > self.values.shape[1]:
+            extra = width - self.values.shape[1]
+            self.values = np.pad(self.values, ((0, 0), (0, extra)))
+            self.counts = np.pad(self.counts, ((0, 0), (0, extra)))
+
+    def _row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.keys):
+                self.keys = np.concatenate([self.keys, np.zeros(len(self.keys), dtype=np.uint64)])
+                self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+            self.rows[key] = row
+            self.keys[row] = key
+            # A new context starts from the context-free values
+            self.values[row, :len(self.base)] = self.base.active_values()
+        return row
+
+    def estimates(self, key):
+        """Return (values, counts) of the responses in context `key`."""
+        base_values = self.base.active_values()
+        row = self.rows.get(key)
+        if row is None:
+            return base_values, np.zeros(len(base_values), dtype=np.int64)
+        self._ensure_width()
+        width = len(base_values)
+        counts = self.counts[row, :width]
+        values = (counts * self.values[row, :width] + self.prior_strength * base_values) / (counts + self.prior_strength)
+        return values, counts
+
+    def view(self, key):
+        """Return a view of the table in context `key` for a selection policy."""
+        return ContextView(self.base, *self.estimates(key))
+
+    def learn(self, key, text, reward, learning_rate=0.1):
+        """Apply the Q-learning update to `text` in context `key` only."""
+        self._ensure_width()
+        row = self._row(key)
+        response_id = self.base.ids[text]
+        old = self.values[row, response_id]
+        self.values[row, response_id] = old + learning_rate * (reward - old)
+        self.counts[row, response_id] += 1
+        return float(self.values[row, response_id])
+
+
+class ContextualQStore:
+    """
+    ContextualQTables for a mapping of name -> QTable, saved to `filepath` (a NumPy .npz
+    file) every `save_interval` seconds and at exit. Rows are stored with the response
+    texts of their columns, so a saved store still loads after responses change.
+
+    Pass the StripedLocks the QTables are updated under as `locks`; learn() must be
+    called under the table's stripe, and save() copies each table's rows under it.
+    The store is per process: several processes saving to one file overwrite each
+    other's rows, as they do with q_values.json.
+    """
+
+    def __init__(self, tables, filepath="q_values.contexts.npz", prior_strength=5.0, save_interval=30.0,
+                 locks=None):
+        self.filepath = filepath
+        self.locks = locks if locks is not None else StripedLocks()
+        self.tables = {name: ContextualQTable(table, prior_strength) for name, table in tables.items()}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._worker = PeriodicWorker(self.save, save_interval)
+        atexit.register(self.close)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def learn(self, name, key, text, reward, learning_rate=0.1):
+        self.dirty = True
+        value = self.tables[name].learn(key, text, reward, learning_rate)
+        self._worker.ensure_started()
+        return value
+
+    def load(self):
+        """Load saved rows from `filepath`, if it exists."""
+        try:
+            data = np.load(self.filepath)
+        except FileNotFoundError:
+            return
+        with data:
+            texts = json.loads(str(data["texts"]))
+            for name, columns in texts.items():
+                table = self.tables.get(name)
+                if table is None:
+                    continue
+                keys, values, counts = data[f"{name}/keys"], data[f"{name}/values"], data[f"{name}/counts"]
+                table._ensure_width()
+                # Map saved columns to the current response IDs by text
+                pairs = [(column, table.base.ids[text]) for column, text in enumerate(columns) if text in table.base.ids]
+                saved = np.array([column for column, _ in pairs], dtype=np.int64)
+                current = np.array([response_id for _, response_id in pairs], dtype=np.int64)
+                for index, key in enumerate(keys.tolist()):
+                    row = table._row(key)
+                    table.values[row, current] = values[index, saved]
+                    table.counts[row, current] = counts[index, saved]
+
+    def save(self):
+        """Write the store to `filepath`, replacing it atomically."""
+        with self._lock:
+            self.dirty = False
+            arrays = {}
+            texts = {}
+            for name, table in self.tables.items():
+                # learn() may grow or reallocate the arrays; copy them under the table's stripe
+                with self.locks.lock_for(id(table.base)):
+                    rows = len(table.rows)
+                    width = len(table.base)
+                    texts[name] = list(table.base.texts)
+                    arrays[f"{name}/keys"] = table.keys[:rows].copy()
+                    arrays[f"{name}/values"] = table.values[:rows, :width].copy()
+                    arrays[f"{name}/counts"] = table.counts[:rows, :width].copy()
+            arrays["texts"] = np.array(json.dumps(texts))
+            directory = os.path.dirname(os.path.abspath(self.filepath))
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".npz", dir=directory)
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        np.savez(f, **arrays)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.filepath)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+            except BaseException:
+                # Saved again at the next interval
+                self.dirty = True
+                raise
+
+    def close(self):
+        self._worker.stop()
+        if self.dirty:
+            self.save()
+
+    def stats(self):
+        return {name: len(table) for name, table in self.tables.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    with np.load(sys.argv[1]) as data:
+        texts = json.loads(str(data["texts"]))
+        for name, columns in texts.items():
+            counts = data[f"{name}/counts"]
+            print(f"{name}: {len(counts)} contexts, {int(counts.sum())} updates, {len(columns)} responses")
@@ -0,0 +1,280 @@
+"""
+Append-only, disk-backed log of conversation turns.
+
+Turns are buffered in memory and appended by a background thread to segment files in
+a directory, rotating to a new segment once the current one reaches `segment_bytes`.
+Each segment `<name>.seg` has an index `<name>.idx` of (offset, session ID) entries,
+so one session's transcript is read back by seeking straight to its records.
+
+Print one session's transcript, or every logged turn, as JSON lines (the per-turn
+format train_offline.py reads):
+    python conversation_log.py conversations SESSION_ID
+    python conversation_log.py conversations
+"""
+import atexit
+import heapq
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from persistence import PeriodicWorker
+
+ROLES = ("user", "bot")
+
+# Record header: CRC-32 of the rest of the record, content length, timestamp,
+# session ID length, role index. The session ID and content follow as UTF-8.
+RECORD_HEADER = struct.Struct("<IIdHB")
+# Index entry: record offset, session ID length. The session ID follows as UTF-8.
+INDEX_ENTRY = struct.Struct("<QH")
+
+
+def encode_record(session_id, role, content, timestamp):
+    sid = session_id.encode("utf-8")
+    text = content.encode("utf-8")
+    body = RECORD_HEADER.pack(0, len(text), timestamp, len(sid), ROLES.index(role))[4:] + sid + text
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+def read_record(f):
+    """
+    Read the record at the current position of `f` and return
+    (session_id, role, content, timestamp), or None at the end of the segment
+    or at a torn record left by a crash.
+    """
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    crc, content_length, timestamp, sid_length, role = RECORD_HEADER.unpack(header)
+    payload = f.read(sid_length + content_length)
+    if len(payload) < sid_length + content_length or zlib.crc32(header[4:] + payload) != crc:
+        return None
+    return (payload[:sid_length].decode("utf-8"), ROLES[role],
+            payload[sid_length:].decode("utf-8"), timestamp)
+
+
+def iter_segment(path):
+    """Yield every (session_id, role, content, timestamp) record of a segment in order."""
+    with open(path, "rb") as f:
+        while True:
+            record = read_record(f)
+            if record is None:
+                return
+            yield record
+
+
+def read_index(path):
+    """Return {session_id: [record offsets]} from a segment index file."""
+    index = {}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return index
+    position = 0
+    while position + INDEX_ENTRY.size <= len(data):
+        offset, sid_length = INDEX_ENTRY.unpack_from(data, position)
+        position += INDEX_ENTRY.size
+        if position + sid_length > len(data):
+            break
+        session_id = data[position:position + sid_length].decode("utf-8")
+        position += sid_length
+        index.setdefault(session_id, []).append(offset)
+    return index
+
+
+class ConversationLog:
+    """
+    Buffered writer and reader for a directory of conversation log segments.
+
+    append() only adds the encoded record to an in-memory buffer; a background thread
+    writes the buffer out every `flush_interval` seconds, or sooner once it holds
+    `flush_threshold` bytes. Each process writes its own segments (their names start
+    with the creation time and process ID), so pre-forked workers can share a directory.
+    """
+
+    def __init__(self, directory="conversations", segment_bytes=64 * 1024 * 1024, flush_interval=1.0,
+                 flush_threshold=256 * 1024, index_cache_size=16):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_threshold = flush_threshold
+        self.index_cache_size = index_cache_size
+        self.records = 0
+        self.segments_written = 0
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._segment = None
+        self._index = None
+        self._segment_size = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._index_cache = OrderedDict()
+        self._worker = PeriodicWorker(self.flush, flush_interval)
+        atexit.register(self.close)
+
+    def append(self, session_id, role, content):
+        """Queue one turn for writing."""
+        record = encode_record(session_id, role, content, time.time())
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child must not write the parent's buffered turns again
+                self._pid = os.getpid()
+                self._buffer = []
+                self._buffered_bytes = 0
+                self._segment = self._index = None
+            self._buffer.append((session_id.encode("utf-8"), record))
+            self._buffered_bytes += len(record)
+            self.records += 1
+            full = self._buffered_bytes >= self.flush_threshold
+        self._worker.ensure_started()
+        if full:
+            self._worker.wake()
+
+    def flush(self):
+        """Write the buffered turns to the current segment and its index."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                self._buffered_bytes = 0
+            if not pending:
+                return
+            written = 0
+            try:
+                data = bytearray()
+                index = bytearray()
+                for position, (sid, record) in enumerate(pending):
+                    if self._segment is None or self._segment_size + len(data) >= self.segment_bytes:
+                        self._write(data, index)
+                        written = position
+                        data, index = bytearray(), bytearray()
+                        self._rotate()
+                    index += INDEX_ENTRY.pack(self._segment_size + len(data), len(sid)) + sid
+                    data += record
+                self._write(data, index)
+            except BaseException:
+                # Keep the turns not written yet for the next flush, ahead of any appended since
+                unwritten = pending[written:]
+                with self._lock:
+                    self._buffer[:0] = unwritten
+                    self._buffered_bytes += sum(len(record) for _, record in unwritten)
+                raise
+
+    def _write(self, data, index):
+        if not data:
+            return
+        # The records are on disk before the index entries that point at them
+        try:
+            self._segment.write(data)
+            self._segment.flush()
+            self._index.write(index)
+            self._index.flush()
+        except BaseException:
+            self._abandon_segment()
+            raise
+        self._segment_size += len(data)
+
+    def _abandon_segment(self):
+        # Cut a partly written batch off the segment and continue in a new one
+        segment, index = self._segment, self._index
+        self._segment = self._index = None
+        try:
+            segment.truncate(self._segment_size)
+        except OSError:
+            pass
+        for f in (segment, index):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _rotate(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments_written += 1
+        name = f"{time.time_ns() // 1000000:015d}-{os.getpid()}-{self.segments_written:06d}"
+        self._segment = open(os.path.join(self.directory, name + ".seg"), "ab")
+        self._index = open(os.path.join(self.directory, name + ".idx"), "ab")
+        self._segment_size = 0
+
+    def close(self):
+        """Write everything still buffered and close the current segment."""
+        self._worker.stop()
+        self.flush()
+        with self._write_lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._index.close()
+                self._segment = self._index = None
+
+    def segments(self):
+        """Return the paths of all segments in the directory, oldest first."""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _segment_index(self, segment):
+        index_path = segment[:-len(".seg")] + ".idx"
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            return {}
+        cached = self._index_cache.get(index_path)
+        if cached is not None and cached[0] == size:
+            self._index_cache.move_to_end(index_path)
+            return cached[1]
+        index = read_index(index_path)
+        self._index_cache[index_path] = (size, index)
+        while len(self._index_cache) > self.index_cache_size:
+            self._index_cache.popitem(last=False)
+        return index
+
+    def transcript(self, session_id):
+        """Return the logged turns of one session as [{"role", "content", "time"}], oldest first."""
+        self.flush()
+        turns = []
+        for segment in self.segments():
+            offsets = self._segment_index(segment).get(session_id)
+            if not offsets:
+                continue
+            with open(segment, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    record = read_record(f)
+                    if record is not None:
+                        turns.append({"role": record[1], "content": record[2], "time": record[3]})
+        # Segments of different worker processes can overlap in time
+        turns.sort(key=lambda turn: turn["time"])
+        return turns
+
+    def iter_turns(self):
+        """
+        Yield every logged turn as {"session_id", "role", "content", "time"}, oldest first.
+        Segments of different worker processes overlap in time, so they are merged by timestamp.
+        """
+        self.flush()
+        segments = [iter_segment(segment) for segment in self.segments()]
+        for session_id, role, content, timestamp in heapq.merge(*segments, key=lambda record: record[3]):
+            yield {"session_id": session_id, "role": role, "content": content, "time": timestamp}
+
+    def stats(self):
+        with self._lock:
+            return {"records": self.records, "buffered_bytes": self._buffered_bytes,
+                    "segments_written": self.segments_written}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__)
+    log = ConversationLog(sys.argv[1])
+    turns = log.transcript(sys.argv[2]) if len(sys.argv) == 3 else log.iter_turns()
+    for turn in turns:
+        print(json.dumps(turn))
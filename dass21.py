@@ -0,0 +1,190 @@
+"""
+DASS-21 scoring, for one respondent at a time or for whole cohorts at once.
+
+Answers are rated 0-3. Questions 1-7 make up the depression subscale, 8-14 anxiety and
+15-21 stress. Subscale scores are doubled to the DASS-42 scale before banding, as in
+the chat questionnaire, so interactive and bulk results always agree.
+"""
+import csv
+import io
+import json
+from bisect import bisect_right
+
+import numpy as np
+
+SUBSCALES = ("depression", "anxiety", "stress")
+QUESTIONS_PER_SUBSCALE = 7
+QUESTION_COUNT = QUESTIONS_PER_SUBSCALE * len(SUBSCALES)
+SEVERITY_LEVELS = ("normal", "mild", "moderate", "high")
+
+# Lowest DASS-42 score of the mild, moderate and high bands of each subscale
+THRESHOLDS = {
+    "depression": (10, 20, 28),
+    "anxiety": (8, 14, 20),
+    "stress": (18, 26, 34),
+}
+
+
+def subscale_of(question_index):
+    """Return the subscale the 0-based `question_index` counts towards."""
+    return SUBSCALES[question_index // QUESTIONS_PER_SUBSCALE]
+
+
+def severity(subscale, score):
+    """Return the severity level ("mild_anxiety", ...) of a raw subscale score."""
+    level = SEVERITY_LEVELS[bisect_right(THRESHOLDS[subscale], score * 2)]
+    return f"{level}_{subscale}"
+
+
+def level_names(subscale):
+    """Severity level names of `subscale`, indexed like the result of band_matrix."""
+    return [f"{level}_{subscale}" for level in SEVERITY_LEVELS]
+
+
+def parse_answers(rows):
+    """
+    Convert a list of answer rows to an (n, 21) int8 array.
+    Raises ValueError naming the first row that is not 21 whole numbers from 0 to 3.
+    """
+    if not len(rows):
+        return np.zeros((0, QUESTION_COUNT), dtype=np.int8)
+    try:
+        answers = np.array(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        answers = None
+    if answers is None or answers.ndim != 2 or answers.shape[1] != QUESTION_COUNT:
+        for index, row in enumerate(rows):
+            if not isinstance(row, (list, tuple)) or len(row) != QUESTION_COUNT:
+                raise ValueError(f"Respondent {index}: expected {QUESTION_COUNT} answers")
+        raise ValueError(f"Expected rows of {QUESTION_COUNT} numeric answers")
+    invalid = ~(np.isin(answers, (0, 1, 2, 3))).all(axis=1)
+    if invalid.any():
+        raise ValueError(f"Respondent {int(np.argmax(invalid))}: answers must be whole numbers from 0 to 3")
+    return answers.astype(np.int8)
+
+
+def parse_json(responses):
+    """
+    Parse the "responses" of a JSON request: a list of answer lists, or of
+    {"id": ..., "answers": [...]} objects. Returns (ids, answers).
+    """
+    if not isinstance(responses, list):
+        raise ValueError("Expected {\"responses\": [[answer, ...], ...]}")
+    ids = []
+    rows = []
+    for index, item in enumerate(responses):
+        if isinstance(item, dict):
+            ids.append(item.get("id", index))
+            rows.append(item.get("answers"))
+        else:
+            ids.append(index)
+            rows.append(item)
+    return ids, parse_answers(rows)
+
+
+def parse_csv(text):
+    """
+    Parse CSV with one respondent per row: 21 answers, optionally preceded by an id
+    column, with or without a header row. Returns (ids, answers).
+    """
+    records = [record for record in csv.reader(io.StringIO(text)) if record]
+    if records and not all(value.strip().isdigit() for value in records[0][-QUESTION_COUNT:]):
+        records = records[1:]
+    ids = []
+    rows = []
+    for index, record in enumerate(records):
+        if len(record) == QUESTION_COUNT + 1:
+            ids.append(record[0])
+            record = record[1:]
+        else:
+            ids.append(index)
+        rows.append(record)
+    return ids, parse_answers(rows)
+
+
+def parse_body(body, content_type):
+    """
+    Parse the body (bytes) of a bulk scoring request: CSV for a text/csv content
+    type, otherwise a JSON object with "responses". Returns (ids, answers).
+    """
+    text = body.decode("utf-8")
+    if content_type == "text/csv":
+        return parse_csv(text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    return parse_json(data.get("responses") if isinstance(data, dict) else None)
+
+
+def score_matrix(answers):
+    """Return the (n, 3) raw depression, anxiety and stress scores of an answer matrix."""
+    answers = np.asarray(answers)
+    return answers.reshape(len(answers), len(SUBSCALES), QUESTIONS_PER_SUBSCALE).sum(axis=2, dtype=np.int64)
+
+
+def band_matrix(scores):
+    """Return the (n, 3) severity level indexes (into SEVERITY_LEVELS) of raw scores."""
+    scaled = np.asarray(scores) * 2
+    bands = np.empty(scaled.shape, dtype=np.int8)
+    for column, subscale in enumerate(SUBSCALES):
+        bands[:, column] = np.searchsorted(THRESHOLDS[subscale], scaled[:, column], side="right")
+    return bands
+
+
+def cohort_stats(scores, bands):
+    """Summary statistics of a cohort's DASS-42 scaled scores and severity levels."""
+    stats = {"respondents": int(len(scores))}
+    for column, subscale in enumerate(SUBSCALES):
+        scaled = np.asarray(scores)[:, column] * 2
+        counts = np.bincount(np.asarray(bands)[:, column], minlength=len(SEVERITY_LEVELS))
+        summary = {"levels": dict(zip(level_names(subscale), counts.tolist()))}
+        if len(scaled):
+            low, median, high = np.percentile(scaled, [25, 50, 75])
+            summary.update({
+                "mean": float(scaled.mean()), "std": float(scaled.std()),
+                "min": int(scaled.min()), "p25": float(low), "median": float(median),
+                "p75": float(high), "max": int(scaled.max()),
+            })
+        stats[subscale] = summary
+    return stats
+
+
+def _result_rows(ids, scores, bands):
+    names = [level_names(subscale) for subscale in SUBSCALES]
+    for respondent, row_scores, row_bands in zip(ids, (scores * 2).tolist(), bands.tolist()):
+        yield respondent, [(score, names[column][band])
+                           for column, (score, band) in enumerate(zip(row_scores, row_bands))]
+
+
+def iter_csv(ids, scores, bands, chunk_size=1000):
+    """Yield the results as CSV text in chunks of `chunk_size` rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id"] + [f"{subscale}_{field}" for subscale in SUBSCALES for field in ("score", "level")])
+    for count, (respondent, columns) in enumerate(_result_rows(ids, scores, bands), 1):
+        writer.writerow([respondent] + [value for column in columns for value in column])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json(ids, scores, bands, chunk_size=1000):
+    """
+    Yield {"results": [...], "cohort": {...}} as JSON text in chunks of `chunk_size`
+    results. Scores are on the DASS-42 scale.
+    """
+    chunk = ['{"results": [']
+    for count, (respondent, columns) in enumerate(_result_rows(ids, scores, bands)):
+        result = {"id": respondent}
+        for subscale, (score, level) in zip(SUBSCALES, columns):
+            result[f"{subscale}_score"] = score
+            result[f"{subscale}_level"] = level
+        chunk.append(("," if count else "") + json.dumps(result))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append('], "cohort": ' + json.dumps(cohort_stats(scores, bands)) + "}")
+    yield "".join(chunk)
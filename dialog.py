@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from intents import IntentMatcher
+from message import Message
+
+logger = logging.getLogger(__name__)
+
+# What to do for a routed message: answer from a response pool (with Q-learning), send a
+# fixed reply, or call a named handler. `next_state` becomes the session's
+# last_question_type; `counts_as_default` increments consecutive_default_responses
+# instead of resetting it.
+Action = namedtuple("Action", "priority pool reply handler next_state counts_as_default min_consecutive_defaults")
+
+ANY_STATE = "*"
+
+
+class CompiledDialog:
+    """
+    A dialog definition compiled for routing.
+
+    Routes are stored in a dispatch table keyed by (state, intent), with ANY_STATE for
+    routes that apply in every state, so routing a message costs one lookup per intent
+    it contains however many intents and routes are defined. Intents found by a
+    detector function instead of keywords are only evaluated when they could win.
+    """
+
+    def __init__(self, definition, pools=None, handlers=None, detectors=None):
+        self.definition = definition
+        intents = definition.get("intents", {})
+        self.keywords = {name: spec["keywords"] for name, spec in intents.items() if "keywords" in spec}
+        self.matcher = IntentMatcher(self.keywords)
+        self.exact = {}
+        for name, spec in intents.items():
+            for text in spec.get("exact", []):
+                self.exact.setdefault(text.lower(), set()).add(name)
+
+        self.dispatch = {}
+        self.detected_routes = []
+        for priority, route in enumerate(definition.get("routes", [])):
+            intent = route["intent"]
+            if intent not in intents:
+                raise ValueError(f"Route for undefined intent {intent!r}")
+            action = self._action(priority, route, pools, handlers)
+            detector = intents[intent].get("detector")
+            if detector is not None:
+                if detectors is None or detector not in detectors:
+                    raise ValueError(f"Unknown detector {detector!r}")
+                self.detected_routes.append((action, route.get("state", ANY_STATE), detectors[detector]))
+            else:
+                self.dispatch.setdefault((route.get("state", ANY_STATE), intent), action)
+
+        self.fallbacks = [self._action(None, fallback, pools, handlers)
+                          for fallback in definition.get("fallbacks", [])]
+        if not self.fallbacks or self.fallbacks[-1].min_consecutive_defaults:
+            raise ValueError("The last fallback must apply unconditionally")
+
+    @staticmethod
+    def _action(priority, spec, pools, handlers):
+        kinds = [key for key in ("pool", "reply", "handler") if key in spec]
+        if len(kinds) != 1:
+            raise ValueError(f"Each route needs exactly one of pool, reply or handler: {spec!r}")
+        if "pool" in spec and pools is not None and spec["pool"] not in pools:
+            raise ValueError(f"Unknown response pool {spec['pool']!r}")
+        if "handler" in spec and handlers is not None and spec["handler"] not in handlers:
+            raise ValueError(f"Unknown handler {spec['handler']!r}")
+        return Action(priority, spec.get("pool"), spec.get("reply"), spec.get("handler"), spec.get("next"),
+                      spec.get("counts_as_default", False), spec.get("min_consecutive_defaults", 0))
+
+    def intents(self, text, lower=None):
+        """
+        Return the set of keyword and exact-match intents in `text`.
+        Pass `lower` if text.lower() is already known.
+        """
+        if lower is None:
+            found = self.matcher.intents(text)
+            lower = text.lower()
+        else:
+            found = self.matcher.intents(lower, lowercase=True)
+        exact = self.exact.get(lower)
+        if exact:
+            found |= exact
+        return found
+
+    def route(self, text, state, consecutive_defaults=0, intents=None):
+        """
+        Return (action, detector result) for a message in dialog state `state`.
+        `intents` may be passed if the message's intents are already known. Detectors
+        are called with `text` as given, so it may be any object they accept.
+        """
+        if intents is None:
+            intents = self.intents(text)
+        best = None
+        for intent in intents:
+            for key in ((state, intent), (ANY_STATE, intent)):
+                action = self.dispatch.get(key)
+                if action is not None and (best is None or action.priority < best.priority):
+                    best = action
+        detected = None
+        for action, route_state, detector in self.detected_routes:
+            if best is not None and action.priority > best.priority:
+                break
+            if route_state not in (ANY_STATE, state):
+                continue
+            result = detector(text)
+            if result:
+                best, detected = action, result
+                break
+        if best is not None:
+            return best, detected
+        for action in self.fallbacks:
+            if consecutive_defaults >= action.min_consecutive_defaults:
+                return action, None
+
+
+class DialogEngine:
+    """
+    Load a dialog definition from a JSON file and keep it compiled.
+
+    The file is checked for changes at most every `check_interval` seconds and
+    recompiled when it changes, so edits take effect without restarting workers.
+    A definition that fails to compile is logged and the previous one stays active.
+    `features` are the message features (see message.py) the detectors read.
+    """
+
+    def __init__(self, path, pools=None, handlers=None, detectors=None, features=None, check_interval=1.0):
+        self.path = path
+        self.pools = pools
+        self.handlers = handlers
+        self.detectors = detectors
+        self.features = features
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.current = None
+        self.reload()
+
+    def reload(self):
+        """Compile the definition file now."""
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r") as f:
+                definition = json.load(f)
+            self.current = CompiledDialog(definition, self.pools, self.handlers, self.detectors)
+            self._mtime = mtime
+            self._checked = time.monotonic()
+
+    def maybe_reload(self):
+        """Recompile the definition if the file changed since it was last loaded."""
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return
+            # Remember the new version even if it fails, so it is only reported once
+            self._mtime = mtime
+            self.reload()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Keeping the previous dialog definition; %s failed to load: %s", self.path, e)
+
+    def get(self):
+        """Return the current CompiledDialog, reloading it first if the file changed."""
+        self.maybe_reload()
+        return self.current
+
+    def route(self, message, state, consecutive_defaults=0):
+        """Route `message`, a str or a Message, with the current definition (see CompiledDialog.route)."""
+        if not isinstance(message, Message):
+            message = Message(message, self.features)
+        dialog = self.get()
+        return dialog.route(message, state, consecutive_defaults, dialog.intents(message.text, message.lower))
@@ -0,0 +1,322 @@
+"""
+Indexed FAQ retrieval.
+
+Each entry has an answer and one or more question phrasings. A message is answered
+from an entry when it contains one of the phrasings word for word (normalized: case,
+hyphens and punctuation are ignored), or else when it is close enough to a phrasing
+by Dice similarity of character trigrams, which tolerates typos and small rewordings.
+A close phrasing must also share its words with the message, each word allowing one
+typo (see words_match): short questions such as "what can you do" differ from
+everyday replies such as "what do you mean" by a single word, which trigram
+similarity alone does not separate.
+
+Phrasings are kept in a dictionary of token sequences and an inverted index from
+(trigram, phrasing length) to phrasings, so a lookup only touches phrasings of a
+compatible length that share rare trigrams with the message, however many entries
+there are. Entries can be added, changed and
+removed one at a time without rebuilding the index.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[\w']+")
+
+
+def normalize_tokens(text):
+    """Lowercase `text` and split it into word tokens; "DASS-21" becomes "dass21"."""
+    return [token.strip("'") for token in _TOKEN.findall(text.lower().replace("-", "")) if token.strip("'")]
+
+
+def char_ngrams(tokens, n=3):
+    """Return the set of character n-grams of the space-joined tokens, padded at both ends."""
+    text = " " + " ".join(tokens) + " "
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def within_one_edit(a, b):
+    """True if `a` and `b` differ by at most one insertion, deletion, substitution or swap of adjacent letters."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    if len(a) < len(b):
+        return a[start:] == b[start + 1:]
+    if a[start + 1:] == b[start + 1:]:
+        return True
+    # Two adjacent letters swapped
+    return (start + 1 < len(a) and a[start] == b[start + 1] and a[start + 1] == b[start]
+            and a[start + 2:] == b[start + 2:])
+
+
+def words_match(tokens, phrase_tokens, max_exact_words=4):
+    """
+    True if each word of a phrasing of up to `max_exact_words` words is within one edit
+    of a different word of the message; longer phrasings may leave one word unmatched.
+    """
+    remaining = list(tokens)
+    unmatched = []
+    for word in phrase_tokens:
+        if word in remaining:
+            remaining.remove(word)
+        else:
+            unmatched.append(word)
+    allowed = 0 if len(phrase_tokens) <= max_exact_words else 1
+    for word in unmatched:
+        for index, token in enumerate(remaining):
+            if within_one_edit(word, token):
+                del remaining[index]
+                break
+        else:
+            allowed -= 1
+            if allowed < 0:
+                return False
+    return True
+
+
+class FAQEngine:
+    """
+    FAQ entries with a phrase index and a trigram index over their question phrasings.
+    Paraphrases match when their trigram Dice similarity is at least `threshold`.
+    """
+
+    def __init__(self, threshold=0.75, ngram_size=3):
+        self.threshold = threshold
+        self.ngram_size = ngram_size
+        self.entries = {}
+        # Phrase ID -> (entry ID, tokens, n-grams); phrase IDs are never reused
+        self._phrases = {}
+        self._entry_phrases = {}
+        self._next_phrase = 0
+        # Exact token sequences -> phrase IDs; (n-gram, phrase n-gram count) -> phrase IDs;
+        # n-gram -> number of phrases containing it; phrase n-gram count -> number of phrases
+        self._sequences = {}
+        self._postings = {}
+        self._df = {}
+        self._lengths = {}
+        self._max_phrase_tokens = 0
+        self._order = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, entry_id):
+        return entry_id in self.entries
+
+    def upsert(self, entry_id, questions, answer):
+        """Add the entry or replace its questions and answer, updating only its own index entries."""
+        if isinstance(questions, str):
+            questions = [questions]
+        with self._lock:
+            self._remove(entry_id)
+            self._order.setdefault(entry_id, len(self._order))
+            self.entries[entry_id] = {"questions": list(questions), "answer": answer}
+            phrase_ids = self._entry_phrases[entry_id] = []
+            for question in questions:
+                tokens = tuple(normalize_tokens(question))
+                if not tokens:
+                    continue
+                phrase_id = self._next_phrase
+                self._next_phrase += 1
+                grams = char_ngrams(tokens, self.ngram_size)
+                self._phrases[phrase_id] = (entry_id, tokens, grams)
+                phrase_ids.append(phrase_id)
+                self._sequences.setdefault(tokens, set()).add(phrase_id)
+                self._max_phrase_tokens = max(self._max_phrase_tokens, len(tokens))
+                self._lengths[len(grams)] = self._lengths.get(len(grams), 0) + 1
+                for gram in grams:
+                    self._postings.setdefault((gram, len(grams)), set()).add(phrase_id)
+                    self._df[gram] = self._df.get(gram, 0) + 1
+
+    def remove(self, entry_id):
+        """Remove the entry, if there is one."""
+        with self._lock:
+            self._remove(entry_id)
+            self.entries.pop(entry_id, None)
+            self._order.pop(entry_id, None)
+
+    def _remove(self, entry_id):
+        for phrase_id in self._entry_phrases.pop(entry_id, []):
+            _, tokens, grams = self._phrases.pop(phrase_id)
+            phrases = self._sequences[tokens]
+            phrases.discard(phrase_id)
+            if not phrases:
+                del self._sequences[tokens]
+            self._lengths[len(grams)] -= 1
+            if not self._lengths[len(grams)]:
+                del self._lengths[len(grams)]
+            for gram in grams:
+                key = (gram, len(grams))
+                self._postings[key].discard(phrase_id)
+                if not self._postings[key]:
+                    del self._postings[key]
+                self._df[gram] -= 1
+                if not self._df[gram]:
+                    del self._df[gram]
+
+    def update(self, entries):
+        """
+        Make the entries from `entries` ({entry ID: {"questions", "answer"}}) current,
+        re-indexing only the ones that are new or changed. Returns the number re-indexed.
+        """
+        changed = 0
+        for entry_id, entry in entries.items():
+            questions = entry["questions"]
+            if isinstance(questions, str):
+                questions = [questions]
+            current = self.entries.get(entry_id)
+            if current is None or current["questions"] != questions or current["answer"] != entry["answer"]:
+                self.upsert(entry_id, questions, entry["answer"])
+                changed += 1
+        return changed
+
+    def match(self, text, tokens=None):
+        """
+        Return (entry ID, similarity) of the best entry for `text`, or None. Exact phrase
+        matches score 1.0. Pass `tokens` if normalize_tokens(text) is already known.
+        """
+        if tokens is None:
+            tokens = normalize_tokens(text)
+        if not tokens:
+            return None
+        with self._lock:
+            exact = self._match_phrase(tokens)
+            if exact is not None:
+                return exact, 1.0
+            return self._match_similar(tokens)
+
+    def lookup(self, text, tokens=None):
+        """Return the answer for `text`, or None if no entry matches."""
+        found = self.match(text, tokens)
+        if found is None:
+            return None
+        return self.entries[found[0]]["answer"]
+
+    def _match_phrase(self, tokens):
+        # Try every span of the message up to the longest phrasing; prefer longer phrasings,
+        # then entries added earlier
+        best = None
+        for length in range(min(self._max_phrase_tokens, len(tokens)), 0, -1):
+            for start in range(len(tokens) - length + 1):
+                phrase_ids = self._sequences.get(tuple(tokens[start:start + length]))
+                if phrase_ids:
+                    for phrase_id in phrase_ids:
+                        entry_id = self._phrases[phrase_id][0]
+                        if best is None or self._order[entry_id] < self._order[best]:
+                            best = entry_id
+            if best is not None:
+                return best
+        return None
+
+    def _match_similar(self, tokens):
+        grams = char_ngrams(tokens, self.ngram_size)
+        size = len(grams)
+        threshold = self.threshold
+        # N-grams no phrasing has are the rarest of all but can never find a candidate
+        rare = sorted((gram for gram in grams if gram in self._df), key=self._df.__getitem__)
+        unindexed = size - len(rare)
+        best = None
+        best_score = threshold
+        for length in self._lengths:
+            # Dice >= t between sets of `size` and `length` n-grams needs an overlap of at
+            # least t * (size + length) / 2, so every match shares at least one of the
+            # message's `size - overlap + 1` rarest n-grams
+            overlap = math.ceil(threshold * (size + length) / 2 - 1e-9)
+            if overlap > min(size, length) or size - overlap + 1 <= unindexed:
+                continue
+            candidates = set()
+            for gram in rare[:size - overlap + 1 - unindexed]:
+                candidates.update(self._postings.get((gram, length), ()))
+            for phrase_id in candidates:
+                entry_id, phrase_tokens, phrase_grams = self._phrases[phrase_id]
+                score = 2 * len(grams & phrase_grams) / (size + length)
+                if (score > best_score or (score == best_score and
+                                           (best is None or self._order[entry_id] < self._order[best]))) \
+                        and words_match(tokens, phrase_tokens):
+                    best, best_score = entry_id, score
+        if best is None:
+            return None
+        return best, best_score
+
+
+def load_entries(path):
+    """
+    Read FAQ entries from a JSON file:
+    {"entries": [{"id": ..., "questions": [...], "answer": ...}, ...]}.
+    Returns {entry ID: {"questions", "answer"}}.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    entries = {}
+    for entry in data["entries"]:
+        questions = entry["questions"]
+        if isinstance(questions, str):
+            questions = [questions]
+        entries[entry.get("id", questions[0])] = {"questions": questions, "answer": entry["answer"]}
+    return entries
+
+
+class FAQFile:
+    """
+    Keep a FAQEngine in step with an external FAQ file on top of built-in entries.
+
+    The file is checked for changes at most every `check_interval` seconds. Changed
+    entries are re-indexed one by one; entries removed from the file are removed from
+    the engine, or revert to the built-in entry of the same ID. A file that fails to
+    load is logged and the current entries stay in use.
+    """
+
+    def __init__(self, engine, path, builtin=None, check_interval=1.0):
+        self.engine = engine
+        self.path = path
+        self.builtin = dict(builtin or {})
+        self.check_interval = check_interval
+        self._file_ids = set()
+        self._mtime = None
+        self._checked = 0.0
+        self._reload_lock = threading.Lock()
+        engine.update(self.builtin)
+        self.maybe_reload(force=True)
+
+    def maybe_reload(self, force=False):
+        """Apply the file's changes if it changed since it was last read."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        with self._reload_lock:
+            self._mtime = mtime
+            try:
+                entries = load_entries(self.path) if mtime is not None else {}
+            except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+                logger.error("Keeping the current FAQ entries; %s failed to load: %s", self.path, e)
+                return
+            for entry_id in self._file_ids - set(entries):
+                if entry_id in self.builtin:
+                    self.engine.upsert(entry_id, self.builtin[entry_id]["questions"], self.builtin[entry_id]["answer"])
+                else:
+                    self.engine.remove(entry_id)
+            self.engine.update(entries)
+            self._file_ids = set(entries)
+
+    def lookup(self, text, tokens=None):
+        self.maybe_reload()
+        return self.engine.lookup(text, tokens)
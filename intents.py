@@ -0,0 +1,109 @@
+import re
+
+
+def _trie_pattern(words):
+    """
+    Build a regex alternation for `words` factored into a prefix trie, e.g.
+    ["stress", "stressed", "stressful"] -> "stress(?:ed|ful)?". The regex engine then
+    walks shared prefixes once instead of retrying every keyword at each position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    optional = "" in node
+    alternatives = [re.escape(ch) + _node_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1 and not optional:
+        return alternatives[0]
+    group = "(?:" + "|".join(alternatives) + ")"
+    return group + "?" if optional else group
+
+
+class IntentMatcher:
+    """
+    Detect every intent in a message with a single regex scan.
+
+    Keywords match whole words only ("no" does not match "know"), case-insensitively.
+    A keyword ending in "*" matches any word starting with it ("overwhelm*" matches
+    "overwhelming"). A keyword that contains another keyword also reports that
+    keyword's intents, so "stress test" is both a DASS-21 command and a stress mention.
+    """
+
+    def __init__(self, keyword_sets=None):
+        self._words = {}
+        self._prefixes = {}
+        self._intents = {}
+        self._pattern = None
+        for intent, keywords in (keyword_sets or {}).items():
+            self._add(intent, keywords)
+        self._compile()
+
+    def add_keywords(self, intent, keywords):
+        """Register more keywords for `intent` and recompile the matcher."""
+        self._add(intent, keywords)
+        self._compile()
+
+    def _add(self, intent, keywords):
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if keyword.endswith("*"):
+                self._prefixes.setdefault(keyword[:-1], set()).add(intent)
+            else:
+                self._words.setdefault(keyword, set()).add(intent)
+
+    def _compile(self):
+        # Intents of every keyword, including keywords nested inside it at word boundaries
+        self._intents = {}
+        for keyword, intents in self._words.items():
+            tokens = keyword.split()
+            nested = set(intents)
+            for i in range(len(tokens)):
+                for j in range(i + 1, len(tokens) + 1):
+                    nested |= self._words.get(" ".join(tokens[i:j]), set())
+            self._intents[keyword] = nested
+
+        alternatives = []
+        if self._words:
+            alternatives.append(r"(?P<word>" + _trie_pattern(self._words) + r")\b")
+        if self._prefixes:
+            alternatives.append(r"(?P<prefix>" + _trie_pattern(self._prefixes) + r")\w*")
+        if alternatives:
+            pattern = r"\b(?:" + "|".join(alternatives) + ")"
+            self._pattern = re.compile(pattern, re.IGNORECASE)
+            # Keywords are stored lowercased, so lowercased text needs no case folding
+            self._lower_pattern = re.compile(pattern)
+        else:
+            self._pattern = None
+            self._lower_pattern = None
+
+    def match(self, text, lowercase=False):
+        """
+        Scan `text` once and return a dictionary mapping each intent found to a list
+        of (start, end) positions of the keywords that triggered it. Pass
+        lowercase=True if `text` is already lowercased, which scans about twice as fast.
+        """
+        found = {}
+        pattern = self._lower_pattern if lowercase else self._pattern
+        if pattern is None:
+            return found
+        for m in pattern.finditer(text):
+            keyword = m.group(m.lastgroup).lower()
+            if m.lastgroup == "word":
+                intents = self._intents[keyword]
+            else:
+                intents = self._prefixes[keyword]
+            for intent in intents:
+                found.setdefault(intent, []).append(m.span())
+        return found
+
+    def intents(self, text, lowercase=False):
+        """Return the set of intents found in `text`."""
+        return set(self.match(text, lowercase))
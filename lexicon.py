@@ -0,0 +1,68 @@
+"""
+Offline, fast loading of the VADER sentiment analyzer.
+
+The VADER lexicon is precompiled once into a marshal file next to this module, which
+loads in a couple of milliseconds and never touches the network. Build it at deploy
+time from the NLTK vader_lexicon data (add --download to fetch that data first):
+    python lexicon.py
+    python lexicon.py --download
+"""
+import marshal
+import os
+import sys
+
+FORMAT_VERSION = 1
+
+DEFAULT_PATH = os.environ.get(
+    "CHATBOT_LEXICON",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vader_lexicon.marshal")
+)
+
+
+def build(path=DEFAULT_PATH, download=False):
+    """Compile the NLTK VADER lexicon to `path` and return the number of entries."""
+    import nltk
+    from nltk.sentiment import SentimentIntensityAnalyzer
+
+    if download:
+        nltk.download("vader_lexicon")
+    lexicon = SentimentIntensityAnalyzer().lexicon
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump((FORMAT_VERSION, lexicon), f)
+    os.replace(tmp_path, path)
+    return len(lexicon)
+
+
+def load_analyzer(path=DEFAULT_PATH):
+    """
+    Create a SentimentIntensityAnalyzer without any network access.
+    Uses the precompiled lexicon at `path` if there is one, otherwise the lexicon
+    from the locally installed NLTK data.
+    """
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+    try:
+        with open(path, "rb") as f:
+            version, lexicon = marshal.load(f)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported lexicon format {version}")
+    except (OSError, EOFError, ValueError, TypeError):
+        try:
+            return SentimentIntensityAnalyzer()
+        except LookupError:
+            raise RuntimeError(
+                "The VADER lexicon is not available offline. Run `python lexicon.py --download` "
+                "once to fetch and precompile it."
+            ) from None
+
+    analyzer = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+    analyzer.lexicon_file = None
+    analyzer.lexicon = lexicon
+    analyzer.constants = VaderConstants()
+    return analyzer
+
+
+if __name__ == "__main__":
+    count = build(download="--download" in sys.argv[1:])
+    print(f"Wrote {count} lexicon entries to {DEFAULT_PATH}")
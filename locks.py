@@ -0,0 +1,59 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """
+    One lock per key (e.g. per session ID), created on first use and dropped once no
+    thread holds or waits for it, so memory use follows the number of busy keys.
+    Threads waiting for the same key get it in the order they asked for it (a ticket
+    lock: threading.Lock makes no such promise).
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                # [condition, next ticket, ticket being served, number of threads holding or waiting]
+                entry = self._locks[key] = [threading.Condition(), 0, 0, 0]
+            entry[3] += 1
+        condition = entry[0]
+        try:
+            with condition:
+                ticket = entry[1]
+                entry[1] += 1
+                while entry[2] != ticket:
+                    condition.wait()
+            try:
+                yield
+            finally:
+                with condition:
+                    entry[2] += 1
+                    condition.notify_all()
+        finally:
+            with self._guard:
+                entry[3] -= 1
+                if entry[3] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        with self._guard:
+            return len(self._locks)
+
+
+class StripedLocks:
+    """
+    A fixed set of locks shared by hash of key: updates to the same key are serialized,
+    updates to different keys usually are not, and the number of locks never grows.
+    """
+
+    def __init__(self, stripes=16):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def lock_for(self, key):
+        return self._locks[hash(key) % len(self._locks)]
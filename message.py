@@ -0,0 +1,49 @@
+"""
+Per-message analysis shared by every stage of a chat turn.
+
+A Message wraps the user's text. Its lowercased text and tokens are computed once,
+on first use, and so is every other feature registered for it (intents, FAQ answer,
+DASS-21 answer, sentiment scores, ...): each stage reads the features it needs as
+attributes and pays only for those.
+"""
+from faq import normalize_tokens
+
+
+class Message:
+    """
+    A user message. `features` maps feature names to functions of the message; a
+    feature is computed the first time it is read as an attribute and then kept.
+    """
+
+    def __init__(self, text, features=None):
+        self.text = text
+        self.features = features or {}
+        self._lower = None
+        self._tokens = None
+
+    @property
+    def lower(self):
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def tokens(self):
+        """The normalized word tokens (see faq.normalize_tokens)."""
+        if self._tokens is None:
+            self._tokens = normalize_tokens(self.lower)
+        return self._tokens
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet
+        features = self.__dict__.get("features")
+        if features is None or name not in features:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        value = self.__dict__[name] = features[name](self)
+        return value
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Message({self.text!r})"
@@ -0,0 +1,254 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(filepath, data):
+    """
+    Write data as JSON to filepath atomically.
+    The file is written to a temporary file in the same directory, synced to disk
+    and then renamed over the target, so readers never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def replay_q_values(filepath, tables):
+    """
+    Load the snapshot at `filepath` and then the delta log next to it into `tables`.
+    Returns (last sequence number applied, number of records in the log).
+    A torn record left by a crash mid-append is truncated away so later appends stay readable.
+    """
+    snapshot_seq = 0
+    try:
+        with open(filepath, "r") as f:
+            data = json.load(f)
+        snapshot_seq = data.get("_seq", 0)
+        for name, table in tables.items():
+            table.update(data.get(name, {}))
+    except FileNotFoundError:
+        pass
+
+    seq = snapshot_seq
+    logged = 0
+    try:
+        with open(filepath + ".log", "r+b") as f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record_seq, name, response, value = json.loads(line)
+                except ValueError:
+                    f.truncate(offset)
+                    break
+                offset += len(line)
+                logged += 1
+                if record_seq <= snapshot_seq or name not in tables:
+                    continue
+                tables[name][response] = value
+                seq = max(seq, record_seq)
+    except FileNotFoundError:
+        pass
+    return seq, logged
+
+
+def last_seq(filepath):
+    """
+    Return the highest sequence number in the snapshot at `filepath` and its delta log,
+    or 0 if there are none. A snapshot written with at least this `_seq` supersedes both.
+    """
+    seq = 0
+    try:
+        with open(filepath, "r") as f:
+            seq = json.load(f).get("_seq", 0)
+    except (FileNotFoundError, ValueError):
+        pass
+    try:
+        with open(filepath + ".log", "rb") as f:
+            for line in f:
+                try:
+                    seq = max(seq, json.loads(line)[0])
+                except (ValueError, IndexError, TypeError):
+                    break
+    except FileNotFoundError:
+        pass
+    return seq
+
+
+class PeriodicWorker:
+    """
+    Run a callback on a daemon thread every `interval` seconds, or sooner when woken.
+    The thread is started lazily and restarted after a fork, since threads do not
+    survive into pre-forked worker processes. A callback that raises is logged and
+    retried at the next interval.
+    """
+
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped = False
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.callback()
+            except Exception:
+                logger.exception("Background write failed; retrying in %s seconds", self.interval)
+
+
+class QValueJournal:
+    """
+    Write-behind persistence for the Q-value tables.
+
+    Updates are recorded in an in-memory journal and a background thread appends
+    them to a delta log (`<filepath>.log`, one JSON record per line) once
+    `flush_threshold` updates are pending or `flush_interval` seconds have passed.
+    After `compact_threshold` logged records the log is compacted into a new
+    snapshot at `filepath`, which is replaced atomically.
+
+    Log records carry absolute values and a sequence number, and the snapshot stores
+    the last sequence number it includes, so replaying snapshot + log at startup is
+    idempotent even if the process died in the middle of a compaction.
+    """
+
+    def __init__(self, filepath="q_values.json", flush_interval=1.0, flush_threshold=50,
+                 compact_threshold=1000):
+        self.filepath = filepath
+        self.log_path = filepath + ".log"
+        self.flush_threshold = flush_threshold
+        self.compact_threshold = compact_threshold
+        self.tables = {}
+        self._pending = []
+        self._seq = 0
+        self._logged_since_compaction = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._worker = PeriodicWorker(self.flush, flush_interval)
+        atexit.register(self.close)
+
+    def load(self, tables):
+        """
+        Replay the snapshot and then the delta log into `tables`, a mapping of
+        category name to response dictionary. The same mapping is used for compaction.
+        """
+        self.tables = tables
+        self._seq, self._logged_since_compaction = replay_q_values(self.filepath, tables)
+
+    def record(self, name, response, value):
+        """Queue the new Q-value of `response` in table `name` for the next flush."""
+        with self._lock:
+            self._seq += 1
+            self._pending.append((self._seq, name, response, value))
+            pending = len(self._pending)
+        self._worker.ensure_started()
+        if pending >= self.flush_threshold:
+            self._worker.wake()
+
+    def flush(self):
+        """Append all pending updates to the delta log, compacting it when it grows too long."""
+        with self._io_lock:
+            self._append_pending()
+            if self._logged_since_compaction >= self.compact_threshold:
+                self._compact()
+
+    def compact(self):
+        """Write a fresh snapshot and truncate the delta log."""
+        with self._io_lock:
+            self._append_pending()
+            self._compact()
+
+    def _append_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        try:
+            self._append(pending)
+        except BaseException:
+            # Keep the updates for the next flush, ahead of any recorded since
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+
+    def _append(self, records):
+        if not records:
+            return
+        data = memoryview("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            start = os.lseek(fd, 0, os.SEEK_END)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                os.fsync(fd)
+            except BaseException:
+                # A partial record would end the log at the next replay; drop what was written
+                try:
+                    os.ftruncate(fd, start)
+                except OSError:
+                    pass
+                raise
+        finally:
+            os.close(fd)
+        self._logged_since_compaction += len(records)
+
+    def _compact(self):
+        with self._lock:
+            seq = self._seq
+            data = {name: dict(table) for name, table in self.tables.items()}
+        data["_seq"] = seq
+        atomic_write_json(self.filepath, data)
+        # Updates recorded after the snapshot was taken are still pending, not in the log
+        with open(self.log_path, "w") as f:
+            os.fsync(f.fileno())
+        self._logged_since_compaction = 0
+
+    def close(self):
+        """Stop the background flusher and persist everything still pending."""
+        self._worker.stop()
+        if self.tables:
+            self.flush()
@@ -0,0 +1,207 @@
+"""
+Bot profiles: alternative sets of response pools and learned Q-values, for example
+per clinic or per language, served by the same workers.
+
+A profile is a directory under the profiles directory holding `responses.json`
+({"pools": {pool name: [response text, ...]}}) and `q_values.npy`, one float64
+Q-value per response in the same order. The Q-values are memory-mapped copy-on-write
+when the profile is first used, so forked workers share the file's pages until they
+learn, and the least recently used profiles are evicted once too many are loaded.
+
+Create a profile from a file in the q_values.json layout ({pool: {response: value}}):
+    python profiles.py create clinic-a clinic-a.json
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from locks import StripedLocks
+from persistence import PeriodicWorker
+from qtable import QTable
+
+
+def write_profile(directory, pools):
+    """
+    Write the pools of a profile ({pool: {response: value}}) to `directory`,
+    replacing each file atomically.
+    """
+    os.makedirs(directory, exist_ok=True)
+    texts = {name: list(pool) for name, pool in pools.items()}
+    values = np.array([float(pools[name][text]) for name in texts for text in texts[name]], dtype=np.float64)
+    _write_values(os.path.join(directory, "q_values.npy"), values)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"pools": texts}, f)
+    os.replace(tmp_path, os.path.join(directory, "responses.json"))
+
+
+def _write_values(path, values):
+    # Mapped copies of the old file keep their pages, so replacing it under running workers is safe
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".npy", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.asarray(values, dtype=np.float64))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Profile:
+    """The response pools (QTables keyed by pool name) of one loaded profile."""
+
+    def __init__(self, name, directory):
+        self.name = name
+        self.directory = directory
+        with open(os.path.join(directory, "responses.json"), "r") as f:
+            pools = json.load(f)["pools"]
+        self.values = np.load(os.path.join(directory, "q_values.npy"), mmap_mode="c")
+        if len(self.values) != sum(len(texts) for texts in pools.values()):
+            raise ValueError(f"Profile {name!r}: q_values.npy does not match responses.json")
+        self.tables = {}
+        offset = 0
+        for pool, texts in pools.items():
+            self.tables[pool] = QTable.from_array(texts, self.values[offset:offset + len(texts)])
+            offset += len(texts)
+        self.dirty = False
+        # Private memory: the texts and counters. Mapped Q-values are only copied once written.
+        self.nbytes = sum(
+            table.counts.nbytes + sum(sys.getsizeof(text) for text in table.texts) for table in self.tables.values()
+        )
+
+    def table_name(self, table):
+        """Return the pool name of one of this profile's tables."""
+        for name, candidate in self.tables.items():
+            if candidate is table:
+                return name
+        raise KeyError("unknown response table")
+
+    def learn(self, pool, text, reward, learning_rate=0.1):
+        self.dirty = True
+        return self.tables[pool].learn(text, reward, learning_rate)
+
+    def save(self, locks):
+        """Write the current Q-values back to q_values.npy, copying each table under its stripe of `locks`."""
+        self.dirty = False
+        values = []
+        for table in self.tables.values():
+            with locks.lock_for(id(table)):
+                values.append(table.active_values().copy())
+        values = np.concatenate(values)
+        try:
+            _write_values(os.path.join(self.directory, "q_values.npy"), values)
+        except BaseException:
+            # Saved again at the next interval
+            self.dirty = True
+            raise
+
+
+class ProfileStore:
+    """
+    Loads profiles from `directory` on first use and keeps at most `max_profiles` of
+    them, using at most about `max_bytes` of private memory, evicting the least
+    recently used. Learned Q-values are written back every `save_interval` seconds
+    and when a profile is evicted. As with q_values.json, when several workers learn
+    for the same profile the last one to write it back wins. Pass the StripedLocks the
+    profiles' tables are updated under as `locks`.
+    """
+
+    def __init__(self, directory="profiles", max_profiles=32, max_bytes=256 * 1024 * 1024, save_interval=30.0,
+                 locks=None):
+        self.directory = directory
+        self.locks = locks if locks is not None else StripedLocks()
+        self.max_profiles = max_profiles
+        self.max_bytes = max_bytes
+        self.loads = 0
+        self.evictions = 0
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker = PeriodicWorker(self.save_dirty, save_interval)
+        atexit.register(self.close)
+
+    def exists(self, name):
+        return (isinstance(name, str) and name not in ("", ".", "..") and os.sep not in name
+                and os.path.isfile(os.path.join(self.directory, name, "responses.json")))
+
+    def names(self):
+        """Return the names of all profiles in the directory."""
+        try:
+            return sorted(name for name in os.listdir(self.directory) if self.exists(name))
+        except FileNotFoundError:
+            return []
+
+    def get(self, name):
+        """Return the loaded Profile `name`, loading it if needed, or None if there is no such profile."""
+        with self._lock:
+            profile = self._profiles.get(name)
+            if profile is not None:
+                self._profiles.move_to_end(name)
+                return profile
+        if not self.exists(name):
+            return None
+        loaded = Profile(name, os.path.join(self.directory, name))
+        evicted = []
+        with self._lock:
+            profile = self._profiles.setdefault(name, loaded)
+            self._profiles.move_to_end(name)
+            if profile is loaded:
+                self.loads += 1
+                total = sum(p.nbytes for p in self._profiles.values())
+                while len(self._profiles) > 1 and (len(self._profiles) > self.max_profiles or total > self.max_bytes):
+                    _, oldest = self._profiles.popitem(last=False)
+                    total -= oldest.nbytes
+                    evicted.append(oldest)
+                    self.evictions += 1
+        for oldest in evicted:
+            if oldest.dirty:
+                oldest.save(self.locks)
+        self._worker.ensure_started()
+        return profile
+
+    def save_dirty(self):
+        with self._lock:
+            dirty = [profile for profile in self._profiles.values() if profile.dirty]
+        for profile in dirty:
+            profile.save(self.locks)
+
+    def close(self):
+        self._worker.stop()
+        self.save_dirty()
+
+    def stats(self):
+        with self._lock:
+            return {"loaded": len(self._profiles), "loads": self.loads, "evictions": self.evictions,
+                    "approx_bytes": sum(profile.nbytes for profile in self._profiles.values())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage bot profiles.")
+    parser.add_argument("--directory", default=os.environ.get("CHATBOT_PROFILES", "profiles"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="create or replace a profile from a q_values.json-style file")
+    create.add_argument("name")
+    create.add_argument("pools")
+    commands.add_parser("list", help="list the profiles")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        with open(args.pools, "r") as f:
+            pools = {name: pool for name, pool in json.load(f).items() if not name.startswith("_")}
+        write_profile(os.path.join(args.directory, args.name), pools)
+        print(f"Wrote profile {args.name} with {sum(len(pool) for pool in pools.values())} responses")
+    else:
+        for name in ProfileStore(args.directory).names():
+            print(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Share Q-value learning between worker processes.
+
+Usage to export the shared table as a q_values.json snapshot:
+    python qsync.py q_values.db q_values.json
+"""
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+
+from locks import StripedLocks
+from persistence import PeriodicWorker, atomic_write_json
+
+
+class QValueSync:
+    """
+    Merge Q-value updates from many processes into a shared SQLite table.
+
+    Each process applies updates to its own tables as usual and also accumulates a
+    (count, reward sum) delta per response. Every `interval` seconds the deltas are
+    merged into the shared table in a single write transaction, and the process then
+    refreshes its tables from the merged values. SQLite serializes the merge
+    transactions, so every update from every worker is applied exactly once.
+
+    n updates with mean reward r are merged with the closed form of applying
+    Q_new = Q_old + learning_rate * (reward - Q_old) n times:
+        Q_new = r + (1 - learning_rate) ** n * (Q_old - r)
+    which is exact when the rewards are equal and order-independent otherwise.
+
+    Pass the StripedLocks the tables are updated under as `locks`; each table is
+    refreshed under its own stripe.
+    """
+
+    def __init__(self, path, learning_rate=0.1, interval=2.0, locks=None):
+        self.path = path
+        self.learning_rate = learning_rate
+        self.locks = locks if locks is not None else StripedLocks()
+        self.tables = {}
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._local = threading.local()
+        self._worker = PeriodicWorker(self.sync, interval)
+        atexit.register(self.close)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS q_values ("
+                "name TEXT NOT NULL, response TEXT NOT NULL, value REAL NOT NULL, "
+                "updates INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (name, response))"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, tables):
+        """
+        Attach `tables`, a mapping of category name to response dictionary. Responses
+        missing from the shared table are seeded with their current local values, then
+        the local tables are refreshed from the shared table.
+        """
+        self.tables = tables
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO q_values (name, response, value) VALUES (?, ?, ?)",
+                [(name, response, value) for name, table in tables.items() for response, value in table.items()]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._refresh(conn)
+
+    def record(self, name, response, reward):
+        """Accumulate one reward for `response` in table `name` for the next merge."""
+        with self._lock:
+            delta = self._deltas.get((name, response))
+            if delta is None:
+                self._deltas[(name, response)] = [1, reward]
+            else:
+                delta[0] += 1
+                delta[1] += reward
+        self._worker.ensure_started()
+
+    def sync(self):
+        """Merge this process's pending deltas into the shared table and refresh the local tables."""
+        with self._sync_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            conn = self._connection()
+            if deltas:
+                rows = []
+                for (name, response), (count, reward_sum) in deltas.items():
+                    mean = reward_sum / count
+                    decay = (1 - self.learning_rate) ** count
+                    rows.append((mean, decay, mean, count, name, response))
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO q_values (name, response, value) VALUES (?, ?, 0.0)",
+                        [(name, response) for name, response in deltas]
+                    )
+                    conn.executemany(
+                        "UPDATE q_values SET value = ? + ? * (value - ?), updates = updates + ? "
+                        "WHERE name = ? AND response = ?",
+                        rows
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    # Put the deltas back so they are merged on the next attempt
+                    with self._lock:
+                        for key, (count, reward_sum) in deltas.items():
+                            delta = self._deltas.setdefault(key, [0, 0.0])
+                            delta[0] += count
+                            delta[1] += reward_sum
+                    raise
+            self._refresh(conn)
+
+    def _refresh(self, conn):
+        rows = {}
+        for name, response, value in conn.execute("SELECT name, response, value FROM q_values"):
+            rows.setdefault(name, []).append((response, value))
+        for name, values in rows.items():
+            table = self.tables.get(name)
+            if table is None:
+                continue
+            with self.locks.lock_for(id(table)):
+                for response, value in values:
+                    table[response] = value
+
+    def export_json(self, filepath):
+        """Write the shared table as a q_values.json snapshot that load_q_values can read."""
+        data = {}
+        for name, response, value in self._connection().execute("SELECT name, response, value FROM q_values"):
+            data.setdefault(name, {})[response] = value
+        atomic_write_json(filepath, data)
+
+    def close(self):
+        """Stop the background merger and merge everything still pending."""
+        self._worker.stop()
+        if self.tables:
+            self.sync()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    QValueSync(sys.argv[1]).export_json(sys.argv[2])
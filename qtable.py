@@ -0,0 +1,171 @@
+import math
+import random
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+class QTable(MutableMapping):
+    """
+    Q-values for one pool of candidate responses, backed by NumPy arrays.
+
+    Each response text gets an integer ID; `values` and `counts` hold the Q-value and
+    the number of updates per ID, and `texts` maps IDs back to text. The table also
+    behaves as a dictionary of response text -> Q-value, so it can be loaded, saved
+    and updated like the plain dictionaries it replaces.
+    """
+
+    def __init__(self, values=None, capacity=8):
+        self.texts = []
+        self.ids = {}
+        self.values = np.zeros(capacity)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self._best = None
+        if values:
+            self.update(values)
+
+    @classmethod
+    def from_array(cls, texts, values):
+        """
+        Create a table over an existing array of Q-values, one per text, such as a
+        slice of a memory-mapped file. Updates are written into that array until the
+        table has to grow.
+        """
+        table = cls(capacity=0)
+        table.texts = list(texts)
+        table.ids = {text: response_id for response_id, text in enumerate(table.texts)}
+        table.values = values
+        table.counts = np.zeros(len(table.texts), dtype=np.int64)
+        return table
+
+    def add(self, text, value=0.0):
+        """Add a response and return its ID."""
+        response_id = len(self.texts)
+        if response_id == len(self.values):
+            grow = max(len(self.values), 8)
+            self.values = np.concatenate([self.values, np.zeros(grow)])
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int64)])
+        self.texts.append(text)
+        self.ids[text] = response_id
+        self.values[response_id] = 0.0
+        self.counts[response_id] = 0
+        self._set(response_id, value)
+        return response_id
+
+    def _set(self, response_id, value):
+        # Keep the greedy choice up to date so exploitation does not scan the table
+        best = self._best
+        if best is None:
+            pass
+        elif response_id == best:
+            if value < self.values[best]:
+                self._best = None
+        elif value > self.values[best] or (value == self.values[best] and response_id < best):
+            self._best = response_id
+        self.values[response_id] = value
+
+    def best(self):
+        """Return the ID with the highest Q-value (the first one on ties)."""
+        if self._best is None:
+            self._best = int(np.argmax(self.values[:len(self.texts)]))
+        return self._best
+
+    def learn(self, text, reward, learning_rate=0.1):
+        """Apply Q_new = Q_old + learning_rate * (reward - Q_old) to `text` and count the visit."""
+        response_id = self.ids[text]
+        old = self.values[response_id]
+        self._set(response_id, old + learning_rate * (reward - old))
+        self.counts[response_id] += 1
+        return float(self.values[response_id])
+
+    def select(self, policy):
+        """Return (response text chosen by `policy`, whether the policy explored)."""
+        response_id, explored = policy.choose(self)
+        return self.texts[response_id], explored
+
+    def active_values(self):
+        return self.values[:len(self.texts)]
+
+    def active_counts(self):
+        return self.counts[:len(self.texts)]
+
+    def __getitem__(self, text):
+        return float(self.values[self.ids[text]])
+
+    def __setitem__(self, text, value):
+        response_id = self.ids.get(text)
+        if response_id is None:
+            self.add(text, value)
+        else:
+            self._set(response_id, value)
+
+    def __delitem__(self, text):
+        # Move the last response into the freed slot to keep IDs dense
+        response_id = self.ids.pop(text)
+        last = len(self.texts) - 1
+        if response_id != last:
+            moved = self.texts[last]
+            self.texts[response_id] = moved
+            self.ids[moved] = response_id
+            self.values[response_id] = self.values[last]
+            self.counts[response_id] = self.counts[last]
+        self.texts.pop()
+        self._best = None
+
+    def __iter__(self):
+        return iter(list(self.texts))
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __repr__(self):
+        return f"QTable({dict(self)!r})"
+
+
+# A policy's choose(table) returns (response ID, explored): explored is True when the
+# pick was made to explore rather than to take the response currently valued highest.
+
+class EpsilonGreedy:
+    """With probability epsilon pick a random response, otherwise the highest Q-value."""
+
+    def __init__(self, epsilon=0.1):
+        self.epsilon = epsilon
+
+    def choose(self, table):
+        if random.random() < self.epsilon:
+            return random.randrange(len(table)), True
+        return table.best(), False
+
+
+class Softmax:
+    """Pick responses with probability proportional to exp(Q / temperature)."""
+
+    def __init__(self, temperature=0.1):
+        self.temperature = temperature
+
+    def choose(self, table):
+        values = table.active_values()
+        weights = np.exp((values - values.max()) / self.temperature)
+        cumulative = np.cumsum(weights)
+        choice = int(np.searchsorted(cumulative, random.random() * cumulative[-1], side="right"))
+        choice = min(choice, len(table) - 1)
+        # Every pick is a sample; it explores when it is not the highest-valued response
+        return choice, bool(values[choice] < values.max())
+
+
+class UCB1:
+    """Try every response once, then pick the highest Q + c * sqrt(ln(total visits) / visits)."""
+
+    def __init__(self, c=math.sqrt(2)):
+        self.c = c
+
+    def choose(self, table):
+        counts = table.active_counts()
+        untried = np.flatnonzero(counts == 0)
+        if len(untried):
+            return int(untried[0]), True
+        values = table.active_values()
+        bonus = self.c * np.sqrt(math.log(counts.sum()) / counts)
+        choice = int(np.argmax(values + bonus))
+        # It explores when the confidence bonus, not the Q-value, made the choice
+        return choice, bool(values[choice] < values.max())
@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """
+    Normalize text for use as a cache key.
+    Only surrounding and repeated whitespace is collapsed: VADER scores depend on
+    capitalization and punctuation ("GREAT!!" scores higher than "great"), so
+    folding those would change the results.
+    """
+    return " ".join(text.split())
+
+
+class SentimentService:
+    """
+    Memoizing wrapper around a VADER SentimentIntensityAnalyzer.
+
+    Scores are kept in a bounded LRU cache keyed on normalized text, so short
+    repeated messages ("no", "not really") are only scored once. Cached score
+    dictionaries are shared between callers and must not be modified.
+
+    Pass `analyzer_factory` instead of `analyzer` to create the analyzer on first use.
+    """
+
+    def __init__(self, analyzer=None, maxsize=10000, analyzer_factory=None):
+        self._analyzer = analyzer
+        self.analyzer_factory = analyzer_factory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            with self._lock:
+                if self._analyzer is None:
+                    self._analyzer = self.analyzer_factory()
+        return self._analyzer
+
+    def score(self, text):
+        """Return VADER polarity scores for `text`."""
+        key = normalize_text(text)
+        with self._lock:
+            scores = self._cache.get(key)
+            if scores is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return scores
+            self.misses += 1
+        scores = self.analyzer.polarity_scores(key)
+        self._store(key, scores)
+        return scores
+
+    def score_batch(self, texts):
+        """
+        Return a list of polarity scores, one per text, in order.
+        Duplicates within the batch and texts already cached are scored only once.
+        """
+        keys = [normalize_text(text) for text in texts]
+        results = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in results:
+                    continue
+                scores = self._cache.get(key)
+                if scores is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    results[key] = scores
+                else:
+                    self.misses += 1
+                    results[key] = None
+                    missing.append(key)
+        for key in missing:
+            results[key] = self.analyzer.polarity_scores(key)
+            self._store(key, results[key])
+        return [results[key] for key in keys]
+
+    def _store(self, key, scores):
+        with self._lock:
+            self._cache[key] = scores
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "maxsize": self.maxsize}
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+def new_dass21_scores():
+    return {"depression": 0, "anxiety": 0, "stress": 0}
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Conversation state for one chat session."""
+    last_question_type: str = None
+    last_response: str = None
+    in_dass21: bool = False
+    dass21_question_index: int = 0
+    dass21_scores: dict = field(default_factory=new_dass21_scores)
+    consecutive_default_responses: int = 0
+    profile: str = None
+    # [profile, pool, response, context key] of the last pool reply, credited with the
+    # sentiment of the user's next message
+    pending_credit: list = None
+
+
+def approx_state_size(state):
+    """Rough number of bytes held by a SessionState."""
+    size = sys.getsizeof(state) + sys.getsizeof(state.dass21_scores)
+    if state.last_response is not None:
+        size += sys.getsizeof(state.last_response)
+    return size
+
+
+def state_to_dict(state):
+    """Convert a SessionState to plain JSON-serializable data."""
+    return {
+        "last_question_type": state.last_question_type,
+        "last_response": state.last_response,
+        "in_dass21": state.in_dass21,
+        "dass21_question_index": state.dass21_question_index,
+        "dass21_scores": state.dass21_scores,
+        "consecutive_default_responses": state.consecutive_default_responses,
+        "profile": state.profile,
+        "pending_credit": state.pending_credit
+    }
+
+
+def state_from_dict(data):
+    """Rebuild a SessionState from the output of state_to_dict."""
+    data = dict(data)
+    # States saved before turns moved to the conversation log still carry their history
+    data.pop("conversation_history", None)
+    return SessionState(**data)
+
+
+class SessionBackend:
+    """
+    Interface for session storage.
+
+    A request calls load() once to get the session state, works on the returned
+    object, and calls save() once when it is done. Backends shared between
+    processes read and write the whole state in those two calls.
+    """
+
+    def load(self, session_id):
+        """Return the SessionState for `session_id`, or a fresh one if there is none."""
+        raise NotImplementedError
+
+    def save(self, session_id, state):
+        """Store `state` as the current state of `session_id`."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return a dictionary of backend counters."""
+        raise NotImplementedError
+
+
+class SessionStore(SessionBackend):
+    """
+    Bounded in-memory store of SessionState objects keyed by session ID.
+
+    Sessions idle for longer than `idle_ttl` seconds are evicted, and once more than
+    `max_sessions` are live the least recently used one is evicted.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=3600):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new_state(self):
+        return SessionState()
+
+    def get(self, session_id):
+        """Return the state for `session_id`, or None if there is none."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def get_or_create(self, session_id):
+        """Return the state for `session_id`, creating a fresh one if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = [self.new_state(), now]
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def load(self, session_id):
+        return self.get_or_create(session_id)
+
+    def save(self, session_id, state):
+        # The state object returned by load() is the stored one, so there is nothing to write
+        pass
+
+    def _expire(self, now):
+        # Entries are kept in access order, so the idle ones are at the front
+        deadline = now - self.idle_ttl
+        while self._sessions:
+            session_id, (state, last_seen) = next(iter(self._sessions.items()))
+            if last_seen >= deadline:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """Return counters for live sessions, evictions and approximate bytes in use."""
+        with self._lock:
+            self._expire(time.monotonic())
+            states = [state for state, last_seen in self._sessions.values()]
+            evictions = self.evictions
+        return {
+            "live_sessions": len(states),
+            "evictions": evictions,
+            "approx_bytes": sum(approx_state_size(state) for state in states)
+        }
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Session storage in a SQLite database shared by every worker process on the host.
+
+    The database runs in WAL mode so readers in one process are not blocked by a
+    writer in another. Each state is stored as one JSON row, read in load() and
+    written in save(). Rows idle for longer than `idle_ttl` seconds are treated as
+    missing and pruned every `prune_every` saves.
+    """
+
+    def __init__(self, path, idle_ttl=3600, prune_every=1000):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.prune_every = prune_every
+        self.evictions = 0
+        self._saves = 0
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_seen REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or forks, so keep one per thread per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, session_id):
+        row = self._connection().execute(
+            "SELECT state, last_seen FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[1] < time.time() - self.idle_ttl:
+            return SessionState()
+        return state_from_dict(json.loads(row[0]))
+
+    def save(self, session_id, state):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, last_seen) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state_to_dict(state)), time.time())
+            )
+        self._saves += 1
+        if self._saves % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete sessions that have been idle for longer than the TTL."""
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.idle_ttl,))
+        self.evictions += cursor.rowcount
+
+    def stats(self):
+        live, approx_bytes = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(state)), 0) FROM sessions WHERE last_seen >= ?",
+            (time.time() - self.idle_ttl,)
+        ).fetchone()
+        return {"live_sessions": live, "evictions": self.evictions, "approx_bytes": approx_bytes}
+
+
+def create_session_backend(url, **options):
+    """
+    Create a session backend from a URL: "memory" for the in-process SessionStore,
+    or "sqlite:///path/to/sessions.db" for storage shared between processes.
+    """
+    if url == "memory":
+        return SessionStore(**options)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionBackend(url[len("sqlite:///"):], **options)
+    raise ValueError(f"Unknown session backend: {url}")
@@ -0,0 +1,111 @@
+import threading
+
+import numpy as np
+import pytest
+
+from contextual import ContextualQStore, ContextualQTable, context_key, sentiment_bucket
+from locks import StripedLocks
+from qtable import EpsilonGreedy, QTable
+
+
+def test_context_key():
+    assert context_key("anxiety", 1, -1) == context_key("anxiety", 1, -1)
+    assert context_key("anxiety", 3, 0) == context_key("anxiety", 7, 0)
+    keys = {context_key(question, defaults, bucket)
+            for question in (None, "anxiety", "stress") for defaults in range(4) for bucket in (-1, 0, 1)}
+    assert len(keys) == 36
+    assert all(0 <= key < 2 ** 64 for key in keys)
+
+
+def test_sentiment_bucket():
+    assert [sentiment_bucket(score) for score in (-0.5, -0.05, 0.0, 0.05, 0.9)] == [-1, -1, 0, 1, 1]
+
+
+def test_unseen_context_uses_base_values():
+    base = QTable({"a": 0.2, "b": 0.5})
+    table = ContextualQTable(base)
+    values, counts = table.estimates(context_key(None, 0, 0))
+    assert values.tolist() == [0.2, 0.5]
+    assert counts.tolist() == [0, 0]
+    assert len(table) == 0
+
+
+def test_learning_is_per_context_and_shrinks_to_base():
+    base = QTable({"a": 0.2, "b": 0.5})
+    table = ContextualQTable(base, prior_strength=5.0)
+    key, other = context_key("anxiety", 0, -1), context_key("anxiety", 0, 1)
+    assert table.learn(key, "a", 1.0, learning_rate=0.5) == pytest.approx(0.6)
+    values, counts = table.estimates(key)
+    assert counts.tolist() == [1, 0]
+    assert values.tolist() == pytest.approx([(1 * 0.6 + 5 * 0.2) / 6, 0.5])
+    assert table.estimates(other)[0].tolist() == [0.2, 0.5]
+    # The base table is untouched
+    assert dict(base) == {"a": 0.2, "b": 0.5}
+
+
+def test_view_select():
+    base = QTable({"a": 0.9, "b": 0.1})
+    table = ContextualQTable(base, prior_strength=1.0)
+    key = context_key("stress", 0, 0)
+    for _ in range(50):
+        table.learn(key, "b", 1.0)
+        table.learn(key, "a", -1.0)
+    assert table.view(key).select(EpsilonGreedy(epsilon=0.0)) == ("b", False)
+    assert base.select(EpsilonGreedy(epsilon=0.0)) == ("a", False)
+
+
+def test_rows_and_columns_grow():
+    base = QTable({"a": 0.0})
+    table = ContextualQTable(base, capacity=2)
+    for defaults in range(4):
+        for bucket in (-1, 0, 1):
+            table.learn(context_key("x", defaults, bucket), "a", 1.0)
+    assert len(table) == 12
+    base["b"] = 0.3
+    key = context_key("x", 0, 0)
+    table.learn(key, "b", 1.0)
+    assert table.estimates(key)[1].tolist() == [1, 1]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "q_values.contexts.npz")
+    tables = {"pool": QTable({"a": 0.1, "b": 0.2, "c": 0.3}), "other": QTable({"x": 0.0})}
+    store = ContextualQStore(tables, path)
+    key = context_key("anxiety", 1, -1)
+    store.learn("pool", key, "b", 1.0)
+    store.learn("pool", key, "c", -1.0)
+    store.close()
+    expected = store["pool"].estimates(key)
+
+    # Reload against a table whose responses changed order and lost "a"
+    reloaded = ContextualQStore({"pool": QTable({"c": 0.3, "b": 0.2, "d": 0.0})}, path)
+    reloaded.load()
+    values, counts = reloaded["pool"].estimates(key)
+    assert counts.tolist() == [1, 1, 0]
+    assert values[:2].tolist() == pytest.approx([expected[0][2], expected[0][1]])
+    assert reloaded.stats() == {"pool": 1}
+    reloaded.close()
+
+
+def test_load_without_file(tmp_path):
+    store = ContextualQStore({"pool": QTable({"a": 0.1})}, str(tmp_path / "missing.npz"))
+    store.load()
+    assert store.stats() == {"pool": 0}
+    assert np.array_equal(store["pool"].estimates(1)[0], [0.1])
+    store.close()
+
+
+def test_save_copies_rows_under_the_table_lock(tmp_path):
+    tables = {"pool": QTable({"a": 0.1})}
+    locks = StripedLocks()
+    store = ContextualQStore(tables, str(tmp_path / "contexts.npz"), locks=locks)
+    store.learn("pool", context_key(None, 0, 0), "a", 1.0)
+    lock = locks.lock_for(id(tables["pool"]))
+    saved = threading.Event()
+    with lock:
+        thread = threading.Thread(target=lambda: (store.save(), saved.set()))
+        thread.start()
+        assert not saved.wait(0.1)
+    thread.join()
+    assert saved.is_set()
+    store.close()
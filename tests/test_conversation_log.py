@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from conversation_log import ConversationLog, encode_record, read_record
+
+
+def test_record_round_trip():
+    record = encode_record("session-é", "bot", "Hello ✓", 12.5)
+    assert read_record(io.BytesIO(record)) == ("session-é", "bot", "Hello ✓", 12.5)
+
+
+def test_torn_and_corrupt_records_are_not_read():
+    record = encode_record("s", "user", "hello there", 1.0)
+    for torn in (record[:5], record[:-1]):
+        assert read_record(io.BytesIO(torn)) is None
+    corrupt = bytearray(record)
+    corrupt[-1] ^= 0xFF
+    assert read_record(io.BytesIO(bytes(corrupt))) is None
+
+
+def test_transcripts_across_segments(tmp_path):
+    log = ConversationLog(str(tmp_path), segment_bytes=200)
+    for turn in range(10):
+        log.append("a", "user", f"a{turn}")
+        log.append("b", "user", f"b{turn}")
+        log.append("a", "bot", f"reply a{turn}")
+    log.close()
+    assert len(log.segments()) > 1
+    transcript = log.transcript("a")
+    assert [turn["content"] for turn in transcript[:4]] == ["a0", "reply a0", "a1", "reply a1"]
+    assert len(transcript) == 20
+    assert [turn["content"] for turn in log.transcript("b")] == [f"b{turn}" for turn in range(10)]
+    assert log.transcript("missing") == []
+    assert sum(1 for _ in log.iter_turns()) == 30
+
+
+def test_torn_tail_after_crash(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    log.append("a", "user", "first")
+    log.append("a", "bot", "second")
+    log.close()
+    segment = log.segments()[0]
+    # A crash in the middle of appending the next record
+    with open(segment, "ab") as f:
+        f.write(encode_record("a", "user", "third", 3.0)[:-3])
+    assert [turn["content"] for turn in ConversationLog(str(tmp_path)).iter_turns()] == ["first", "second"]
+
+
+def test_turns_are_kept_when_a_flush_fails(tmp_path):
+    directory = tmp_path / "conversations"
+    log = ConversationLog(str(directory))
+    # A file where the directory should be makes the flush fail
+    directory.write_text("")
+    log.append("a", "user", "first")
+    with pytest.raises(OSError):
+        log.flush()
+    log.append("a", "bot", "second")
+    directory.unlink()
+    log.close()
+    assert [turn["content"] for turn in log.transcript("a")] == ["first", "second"]
+
+
+def test_turns_of_overlapping_segments_are_merged_by_time(tmp_path):
+    # Two worker processes served the same session, each writing its own segment
+    turns = [("a", "user", "I'm stressed", 1.0), ("a", "bot", "take a break", 2.0),
+             ("a", "user", "good idea", 3.0), ("a", "bot", "glad to help", 4.0)]
+    for worker, records in (("100", turns[0::2]), ("200", turns[1::2])):
+        with open(tmp_path / f"000000000000001-{worker}-000001.seg", "wb") as f:
+            for session_id, role, content, timestamp in records:
+                f.write(encode_record(session_id, role, content, timestamp))
+    log = ConversationLog(str(tmp_path))
+    assert [turn["content"] for turn in log.iter_turns()] == [content for _, _, content, _ in turns]
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from dass21 import (QUESTION_COUNT, SUBSCALES, band_matrix, cohort_stats, iter_csv, iter_json, level_names,
+                    parse_body, score_matrix, severity, subscale_of)
+
+
+def interactive_levels(answers):
+    """Score one respondent the way the chat questionnaire does, one answer at a time."""
+    scores = {subscale: 0 for subscale in SUBSCALES}
+    for index, answer in enumerate(answers):
+        scores[subscale_of(index)] += answer
+    return [scores[subscale] for subscale in SUBSCALES], [severity(subscale, scores[subscale]) for subscale in SUBSCALES]
+
+
+def every_subscale_score():
+    # Each subscale takes every score from 0 to 21, so every band boundary is crossed
+    rows = []
+    for total in range(22):
+        row = []
+        for _ in SUBSCALES:
+            answers = [3] * (total // 3) + ([total % 3] if total % 3 else [])
+            row += answers + [0] * (7 - len(answers))
+        rows.append(row)
+    return np.array(rows, dtype=np.int8)
+
+
+@pytest.mark.parametrize("answers", [
+    every_subscale_score(),
+    np.random.default_rng(0).integers(0, 4, size=(2000, QUESTION_COUNT), dtype=np.int8),
+])
+def test_vectorized_matches_interactive(answers):
+    scores = score_matrix(answers)
+    bands = band_matrix(scores)
+    names = [level_names(subscale) for subscale in SUBSCALES]
+    for row, row_scores, row_bands in zip(answers.tolist(), scores.tolist(), bands.tolist()):
+        expected_scores, expected_levels = interactive_levels(row)
+        assert row_scores == expected_scores
+        assert [names[column][band] for column, band in enumerate(row_bands)] == expected_levels
+
+
+def test_parse_body():
+    rows = [[1] * QUESTION_COUNT, [2] * QUESTION_COUNT]
+    ids, answers = parse_body(json.dumps({"responses": [rows[0], {"id": "b", "answers": rows[1]}]}).encode(),
+                              "application/json")
+    assert ids == [0, "b"]
+    assert answers.tolist() == rows
+
+    header = ",".join(["id"] + [f"q{i}" for i in range(1, QUESTION_COUNT + 1)])
+    text = header + "\n" + "\n".join(f"r{i}," + ",".join(map(str, row)) for i, row in enumerate(rows))
+    ids, answers = parse_body(text.encode(), "text/csv")
+    assert ids == ["r0", "r1"]
+    assert answers.tolist() == rows
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b"not json", json.dumps({"responses": [[4] * QUESTION_COUNT]}).encode(),
+                                  json.dumps({"responses": [[1] * 20]}).encode()])
+def test_parse_body_rejects(body):
+    with pytest.raises(ValueError):
+        parse_body(body, "application/json")
+
+
+def test_streamed_results():
+    answers = np.random.default_rng(1).integers(0, 4, size=(25, QUESTION_COUNT), dtype=np.int8)
+    scores = score_matrix(answers)
+    bands = band_matrix(scores)
+    ids = list(range(len(answers)))
+
+    report = json.loads("".join(iter_json(ids, scores, bands, chunk_size=7)))
+    assert len(report["results"]) == 25
+    assert report["cohort"] == json.loads(json.dumps(cohort_stats(scores, bands)))
+    first = report["results"][0]
+    assert first["depression_score"] == int(scores[0, 0]) * 2
+    assert first["depression_level"] == severity("depression", int(scores[0, 0]))
+
+    lines = "".join(iter_csv(ids, scores, bands, chunk_size=7)).splitlines()
+    assert len(lines) == 26
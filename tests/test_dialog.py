@@ -0,0 +1,24 @@
+import os
+
+from dialog import DialogEngine
+from message import Message
+
+DIALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dialog.json")
+
+
+def engine():
+    features = {"faq": lambda message: "answer" if message.lower == "what can you do" else None}
+    return DialogEngine(DIALOG, detectors={"faq": lambda message: message.faq}, features=features)
+
+
+def test_route_wraps_text_in_a_message():
+    action, detected = engine().route("What can you do", None)
+    assert action.handler == "faq"
+    assert detected == "answer"
+
+
+def test_route_accepts_a_message():
+    dialog = engine()
+    action, detected = dialog.route(Message("I'm so stressed", dialog.features), None)
+    assert action.pool == "stress_responses"
+    assert detected is None
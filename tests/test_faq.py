@@ -0,0 +1,158 @@
+import json
+import random
+
+import pytest
+
+from faq import FAQEngine, FAQFile, char_ngrams, normalize_tokens, within_one_edit, words_match
+
+WORDS = ["what", "are", "your", "opening", "hours", "how", "do", "i", "book", "an", "appointment", "cancel",
+         "where", "is", "the", "clinic", "parking", "price", "session", "insurance", "cover", "therapy", "online"]
+
+
+def brute_force_match(engine, text):
+    """Compare the message with every phrasing, without the indexes."""
+    tokens = normalize_tokens(text)
+    if not tokens:
+        return None
+    order = {entry_id: index for index, entry_id in enumerate(engine.entries)}
+    phrasings = [(entry_id, tuple(normalize_tokens(question)))
+                 for entry_id, entry in engine.entries.items() for question in entry["questions"]]
+    phrasings = [(entry_id, phrase) for entry_id, phrase in phrasings if phrase]
+
+    contained = [(len(phrase), -order[entry_id], entry_id) for entry_id, phrase in phrasings
+                 if any(tuple(tokens[i:i + len(phrase)]) == phrase for i in range(len(tokens)))]
+    if contained:
+        return max(contained)[2], 1.0
+
+    grams = char_ngrams(tokens)
+    best = None
+    for entry_id, phrase in phrasings:
+        phrase_grams = char_ngrams(phrase)
+        score = 2 * len(grams & phrase_grams) / (len(grams) + len(phrase_grams))
+        if score >= engine.threshold and words_match(tokens, phrase) and \
+                (best is None or (score, -order[entry_id]) > (best[1], -order[best[0]])):
+            best = (entry_id, score)
+    return best
+
+
+def typo(rng, text):
+    chars = list(text)
+    for _ in range(rng.randint(0, 2)):
+        position = rng.randrange(len(chars))
+        if rng.random() < 0.5:
+            del chars[position]
+        else:
+            chars.insert(position, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(chars) or text
+
+
+@pytest.fixture
+def corpus():
+    rng = random.Random(0)
+    entries = {}
+    for index in range(300):
+        questions = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(1, 3))]
+        entries[f"entry{index}"] = {"questions": questions, "answer": f"answer {index}"}
+    return entries
+
+
+def queries(rng, entries, count):
+    questions = [question for entry in entries.values() for question in entry["questions"]]
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            yield typo(rng, rng.choice(questions))
+        elif kind < 0.7:
+            yield "hi, " + rng.choice(questions) + " please?"
+        else:
+            yield " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+
+
+def test_same_matches_as_brute_force(corpus):
+    engine = FAQEngine()
+    engine.update(corpus)
+    rng = random.Random(1)
+    for text in queries(rng, corpus, 500):
+        assert engine.match(text) == brute_force_match(engine, text), text
+
+
+def test_same_matches_after_incremental_updates(corpus):
+    engine = FAQEngine()
+    engine.update(corpus)
+    rng = random.Random(2)
+    for entry_id in rng.sample(sorted(corpus), 50):
+        engine.remove(entry_id)
+    for entry_id in rng.sample(sorted(engine.entries), 50):
+        engine.upsert(entry_id, [" ".join(rng.choice(WORDS) for _ in range(4))], "changed")
+    for text in queries(rng, corpus, 300):
+        assert engine.match(text) == brute_force_match(engine, text), text
+
+
+def test_exact_and_paraphrase_lookup():
+    engine = FAQEngine()
+    engine.update({"hours": {"questions": ["opening hours", "when are you open"], "answer": "9 to 5"}})
+    assert engine.lookup("What are your OPENING hours?") == "9 to 5"
+    assert engine.lookup("when are yuo open") == "9 to 5"
+    assert engine.lookup("where do I park") is None
+    assert engine.update({"hours": {"questions": ["opening hours", "when are you open"], "answer": "9 to 5"}}) == 0
+
+
+def test_faq_file_overrides_and_reverts(tmp_path):
+    path = tmp_path / "faq.json"
+    builtin = {"hours": {"questions": ["opening hours"], "answer": "builtin"}}
+    path.write_text(json.dumps({"entries": [{"id": "hours", "questions": ["opening hours"], "answer": "file"},
+                                            {"id": "parking", "questions": "where can i park", "answer": "behind"}]}))
+    engine = FAQEngine()
+    faq_file = FAQFile(engine, str(path), builtin)
+    assert faq_file.lookup("opening hours") == "file"
+    assert faq_file.lookup("where can I park") == "behind"
+
+    path.write_text(json.dumps({"entries": []}))
+    faq_file.maybe_reload(force=True)
+    assert faq_file.lookup("opening hours") == "builtin"
+    assert faq_file.lookup("where can I park") is None
+
+
+BUILTIN = {
+    "what can you do": {"questions": ["what can you do", "what do you do"], "answer": "abilities"},
+    "who made you": {"questions": ["who made you", "who created you"], "answer": "maker"},
+    "how does this work": {"questions": ["how does this work", "how does it work"], "answer": "how"},
+    "what is dass21": {"questions": ["what is dass21", "what is dass"], "answer": "dass"},
+}
+
+
+@pytest.mark.parametrize("text", [
+    "what do you mean", "what do you want", "what did you do", "what do you say", "what do you think",
+    "what should i do", "who are they", "how does that feel",
+])
+def test_everyday_replies_are_not_paraphrases(text):
+    engine = FAQEngine()
+    engine.update(BUILTIN)
+    assert engine.match(text) is None
+
+
+@pytest.mark.parametrize("text, entry_id", [
+    ("what cn you do", "what can you do"),
+    ("who mad you", "who made you"),
+    ("how dose this work", "how does this work"),
+    ("what is das21", "what is dass21"),
+    ("wht is dass", "what is dass21"),
+])
+def test_typos_are_paraphrases(text, entry_id):
+    engine = FAQEngine()
+    engine.update(BUILTIN)
+    assert engine.match(text)[0] == entry_id
+
+
+def test_within_one_edit():
+    for a, b in [("you", "yuo"), ("does", "dose"), ("made", "mad"), ("can", "cn"), ("abc", "abd"), ("x", "")]:
+        assert within_one_edit(a, b) and within_one_edit(b, a)
+    for a, b in [("did", "do"), ("can", "mean"), ("abc", "bca"), ("ab", "cd")]:
+        assert not within_one_edit(a, b) and not within_one_edit(b, a)
+
+
+def test_words_match():
+    assert words_match(["what", "cn", "you", "do"], ("what", "can", "you", "do"))
+    assert not words_match(["what", "do", "you", "mean"], ("what", "do", "you", "do"))
+    # Longer phrasings tolerate one reworded word
+    assert words_match(["how", "do", "i", "book", "a", "session"], ("how", "do", "i", "book", "an", "appointment"))
@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Posts each case to the Flask app and to the ASGI app, printing [path, body, flask status, asgi status]
+SCRIPT = """
+import asyncio, json, sys
+sys.path.insert(0, sys.argv[1])
+import chatbot, asgi
+
+async def asgi_status(path, body, content_type):
+    scope = {"type": "http", "method": "POST", "path": path.split("?")[0],
+             "query_string": path.partition("?")[2].encode(), "headers": [(b"content-type", content_type.encode())]}
+    sent = []
+    async def receive():
+        return {"type": "http.request", "body": body.encode()}
+    async def send(message):
+        sent.append(message)
+    await asgi.application(scope, receive, send)
+    return sent[0]["status"]
+
+client = chatbot.app.test_client()
+for path, body, content_type in json.loads(sys.stdin.read()):
+    flask_status = client.post(path, data=body, content_type=content_type).status_code
+    print(json.dumps([path, body, flask_status, asyncio.run(asgi_status(path, body, content_type))]))
+"""
+
+
+def post_to_both(tmp_path, cases):
+    shutil.copy(os.path.join(ROOT, "q_values.json"), tmp_path)
+    result = subprocess.run([sys.executable, "-c", SCRIPT, ROOT], input=json.dumps(cases), cwd=tmp_path,
+                            check=True, capture_output=True, text=True)
+    return [json.loads(line) for line in result.stdout.splitlines()]
+
+
+def test_frontends_reject_the_same_requests(tmp_path):
+    cases = [
+        ["/chat", json.dumps({"message": 5}), "application/json"],
+        ["/chat", json.dumps([1]), "application/json"],
+        ["/chat", "not json", "application/json"],
+        ["/chat", json.dumps({"message": "hi", "profile": "no-such-profile"}), "application/json"],
+        ["/chat/batch", json.dumps({"messages": [1]}), "application/json"],
+        ["/chat/batch", json.dumps({"messages": [{"message": "hi"}] * 1001}), "application/json"],
+        ["/chat/batch", json.dumps({"messages": [{"session_id": "x" * 257, "message": "hi"}]}), "application/json"],
+        ["/dass21/bulk?format=xml", "[]", "application/json"],
+        ["/dass21/bulk", "not json", "application/json"],
+    ]
+    for path, body, flask_status, asgi_status in post_to_both(tmp_path, cases):
+        assert (flask_status, asgi_status) == (400, 400), (path, body[:60])
+
+
+def test_frontends_accept_valid_requests(tmp_path):
+    cases = [
+        ["/chat", json.dumps({"message": "hi"}), "application/json"],
+        ["/chat", json.dumps({}), "application/json"],
+        ["/chat/batch", json.dumps({"messages": [{"session_id": "a", "message": "hi"}]}), "application/json"],
+        ["/dass21/bulk?format=cohort", json.dumps({"responses": [[1] * 21]}), "application/json"],
+    ]
+    for path, body, flask_status, asgi_status in post_to_both(tmp_path, cases):
+        assert (flask_status, asgi_status) == (200, 200), (path, body[:60])
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+
+import pytest
+
+from intents import IntentMatcher, _trie_pattern
+
+KEYWORDS = {
+    "stress": ["stress", "stressed", "stressful", "overwhelm*", "pressure"],
+    "dass21": ["dass21", "stress test", "test me"],
+    "negative": ["no", "not really", "nope"],
+}
+
+
+def reference_intents(keyword_sets, text):
+    """One regex search per keyword, the way intents were detected before the matcher."""
+    found = set()
+    for intent, keywords in keyword_sets.items():
+        for keyword in keywords:
+            if keyword.endswith("*"):
+                pattern = r"\b" + re.escape(keyword[:-1]) + r"\w*"
+            else:
+                pattern = r"\b" + re.escape(keyword) + r"\b"
+            if re.search(pattern, text, re.IGNORECASE):
+                found.add(intent)
+    return found
+
+
+def test_trie_pattern_matches_exactly_its_words():
+    pattern = re.compile(_trie_pattern(["stress", "stressed", "stressful", "sad"]) + r"\Z")
+    for word in ("stress", "stressed", "stressful", "sad"):
+        assert pattern.match(word)
+    for word in ("stres", "stressfu", "sa", "sadd"):
+        assert not pattern.match(word)
+
+
+@pytest.mark.parametrize("text", [
+    "I'm stressed about work",
+    "I KNOW it's fine",
+    "no, not really",
+    "Feeling overwhelmed and under pressure",
+    "can you do a stress test on me",
+    "test me please",
+    "nothing much",
+    "",
+])
+def test_matches_reference(text):
+    matcher = IntentMatcher(KEYWORDS)
+    assert matcher.intents(text) == reference_intents(KEYWORDS, text)
+    assert matcher.intents(text.lower(), lowercase=True) == matcher.intents(text)
+
+
+def test_whole_words_only():
+    matcher = IntentMatcher(KEYWORDS)
+    assert "negative" not in matcher.intents("I know")
+    assert "stress" not in matcher.intents("distressing")
+
+
+def test_nested_keywords_report_both_intents():
+    matcher = IntentMatcher(KEYWORDS)
+    assert matcher.intents("stress test") == {"stress", "dass21"}
+
+
+def test_match_positions():
+    matcher = IntentMatcher(KEYWORDS)
+    assert matcher.match("No pressure") == {"negative": [(0, 2)], "stress": [(3, 11)]}
+
+
+def test_add_keywords():
+    matcher = IntentMatcher()
+    assert matcher.intents("I feel sad") == set()
+    matcher.add_keywords("sad", ["sad", "unhapp*"])
+    assert matcher.intents("I feel sad") == {"sad"}
+    assert matcher.intents("so unhappy") == {"sad"}
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("I'm worried about tomorrow", "anxiety"),
+    ("it worries me", "anxiety"),
+    ("I feel nervous", "anxiety"),
+    ("I'm fearful", "anxiety"),
+    ("work is stressing me out", "stress"),
+    ("I feel hurt", "sad"),
+    ("I was upset", "sad"),
+    ("such sadness", "sad"),
+    ("I'm so stressed", "stress"),
+    ("a stressful week", "stress"),
+    ("I feel overwhelmed", "stress"),
+    ("I fear the worst", "anxiety"),
+])
+def test_dialog_keywords_match_inflections(text, intent):
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dialog.json")) as f:
+        intents = json.load(f)["intents"]
+    matcher = IntentMatcher({name: spec["keywords"] for name, spec in intents.items() if "keywords" in spec})
+    assert intent in matcher.intents(text)
+
+
+def test_dialog_keywords_are_not_covered_by_prefixes():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dialog.json")) as f:
+        intents = json.load(f)["intents"]
+    for name, spec in intents.items():
+        keywords = spec.get("keywords", [])
+        prefixes = [keyword[:-1] for keyword in keywords if keyword.endswith("*")]
+        # "stress" stays a literal so the phrase "stress test" nests inside it
+        covered = [keyword for keyword in keywords if not keyword.endswith("*") and keyword != "stress"
+                   and " " not in keyword and any(keyword.startswith(prefix) for prefix in prefixes)]
+        assert covered == [], name
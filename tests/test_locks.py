@@ -0,0 +1,49 @@
+import threading
+import time
+
+from locks import KeyedLocks
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_waiters_get_the_key_in_arrival_order():
+    locks = KeyedLocks()
+    order = []
+
+    def turn(number):
+        with locks.hold("session"):
+            order.append(number)
+
+    threads = []
+    with locks.hold("session"):
+        for number in range(20):
+            thread = threading.Thread(target=turn, args=(number,))
+            thread.start()
+            threads.append(thread)
+            # Each thread has taken its ticket before the next one starts
+            wait_until(lambda: locks._locks["session"][1] == number + 2)
+    for thread in threads:
+        thread.join()
+    assert order == list(range(20))
+    assert len(locks) == 0
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    locks = KeyedLocks()
+    done = threading.Event()
+
+    def other_key():
+        with locks.hold("b"):
+            done.set()
+
+    with locks.hold("a"):
+        thread = threading.Thread(target=other_key)
+        thread.start()
+        assert done.wait(5)
+    thread.join()
+    assert len(locks) == 0
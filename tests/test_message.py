@@ -0,0 +1,41 @@
+import pytest
+
+from message import Message
+
+
+def test_features_are_computed_once():
+    calls = []
+
+    def length(message):
+        calls.append(message.text)
+        return len(message.tokens)
+
+    message = Message("I'm feeling STRESSED about DASS-21", {"length": length})
+    assert calls == []
+    assert message.length == 5
+    assert message.length == 5
+    assert calls == ["I'm feeling STRESSED about DASS-21"]
+
+
+def test_lower_and_tokens():
+    message = Message("I'm feeling STRESSED about DASS-21")
+    assert message.lower == "i'm feeling stressed about dass-21"
+    assert message.tokens == ["i'm", "feeling", "stressed", "about", "dass21"]
+    assert message.tokens is message.tokens
+    assert str(message) == message.text
+
+
+def test_features_can_use_other_features():
+    features = {
+        "words": lambda message: set(message.tokens),
+        "stressed": lambda message: "stressed" in message.words,
+    }
+    assert Message("so stressed", features).stressed
+    assert not Message("all good", features).stressed
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        Message("hi", {"length": len}).sentiment
+    with pytest.raises(AttributeError):
+        Message("hi").length
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+
+import pytest
+
+from persistence import PeriodicWorker, QValueJournal, atomic_write_json, last_seq, replay_q_values
+
+
+def write_log(path, records, tail=""):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write(tail)
+
+
+def test_replay_applies_log_over_snapshot(tmp_path):
+    snapshot = tmp_path / "q_values.json"
+    snapshot.write_text(json.dumps({"pool": {"a": 0.1, "b": 0.2}, "_seq": 0}))
+    write_log(str(snapshot) + ".log", [[1, "pool", "a", 0.5], [2, "pool", "c", 0.7], [3, "pool", "a", 0.6]])
+    tables = {"pool": {}}
+    assert replay_q_values(str(snapshot), tables) == (3, 3)
+    assert tables == {"pool": {"a": 0.6, "b": 0.2, "c": 0.7}}
+
+
+def test_replay_skips_records_already_in_snapshot(tmp_path):
+    # A crash between writing the snapshot and truncating the log leaves older records behind
+    snapshot = tmp_path / "q_values.json"
+    snapshot.write_text(json.dumps({"pool": {"a": 0.9}, "_seq": 2}))
+    write_log(str(snapshot) + ".log", [[1, "pool", "a", 0.1], [2, "pool", "a", 0.2], [3, "pool", "b", 0.3]])
+    tables = {"pool": {}}
+    assert replay_q_values(str(snapshot), tables) == (3, 3)
+    assert tables == {"pool": {"a": 0.9, "b": 0.3}}
+
+
+def test_replay_is_idempotent(tmp_path):
+    snapshot = tmp_path / "q_values.json"
+    snapshot.write_text(json.dumps({"pool": {"a": 0.1}, "_seq": 0}))
+    write_log(str(snapshot) + ".log", [[1, "pool", "a", 0.5], [2, "pool", "b", 0.4]])
+    first, second = {"pool": {}}, {"pool": {}}
+    replay_q_values(str(snapshot), first)
+    replay_q_values(str(snapshot), second)
+    replay_q_values(str(snapshot), second)
+    assert first == second == {"pool": {"a": 0.5, "b": 0.4}}
+
+
+def test_replay_truncates_torn_record(tmp_path):
+    snapshot = tmp_path / "q_values.json"
+    log = str(snapshot) + ".log"
+    write_log(log, [[1, "pool", "a", 0.5]], tail='[2, "pool", "a", 0.')
+    tables = {"pool": {}}
+    assert replay_q_values(str(snapshot), tables) == (1, 1)
+    assert tables == {"pool": {"a": 0.5}}
+    with open(log) as f:
+        assert f.read() == json.dumps([1, "pool", "a", 0.5]) + "\n"
+
+    # Records appended after the truncation are read back
+    with open(log, "a") as f:
+        f.write(json.dumps([2, "pool", "b", 0.3]) + "\n")
+    tables = {"pool": {}}
+    assert replay_q_values(str(snapshot), tables) == (2, 2)
+    assert tables == {"pool": {"a": 0.5, "b": 0.3}}
+
+
+def test_replay_ignores_unknown_tables(tmp_path):
+    snapshot = tmp_path / "q_values.json"
+    write_log(str(snapshot) + ".log", [[1, "gone", "a", 0.5], [2, "pool", "a", 0.2]])
+    tables = {"pool": {}}
+    replay_q_values(str(snapshot), tables)
+    assert tables == {"pool": {"a": 0.2}}
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "q_values.json")
+    journal = QValueJournal(path, flush_threshold=2, compact_threshold=3)
+    tables = {"pool": {"a": 0.0}}
+    journal.load(tables)
+    for value in (0.1, 0.2, 0.3, 0.4, 0.5):
+        tables["pool"]["a"] = value
+        journal.record("pool", "a", value)
+        journal.flush()
+    journal.close()
+
+    restored = {"pool": {}}
+    seq, _ = replay_q_values(path, restored)
+    assert seq == 5
+    assert restored == {"pool": {"a": 0.5}}
+
+
+def test_last_seq(tmp_path):
+    snapshot = tmp_path / "q_values.json"
+    assert last_seq(str(snapshot)) == 0
+    snapshot.write_text(json.dumps({"pool": {}, "_seq": 4}))
+    assert last_seq(str(snapshot)) == 4
+    write_log(str(snapshot) + ".log", [[5, "pool", "a", 0.5], [7, "pool", "a", 0.6]], tail="[8, ")
+    assert last_seq(str(snapshot)) == 7
+
+
+def test_snapshot_at_last_seq_supersedes_log(tmp_path):
+    # What train_offline writes over a deployment's q_values.json
+    path = str(tmp_path / "q_values.json")
+    atomic_write_json(path, {"pool": {"a": 0.1}, "_seq": 0})
+    write_log(path + ".log", [[5, "pool", "a", 0.9]])
+    atomic_write_json(path, {"pool": {"a": 0.3}, "_seq": last_seq(path)})
+    tables = {"pool": {}}
+    replay_q_values(path, tables)
+    assert tables == {"pool": {"a": 0.3}}
+
+
+def test_periodic_worker_survives_failing_callback():
+    calls = []
+
+    def callback():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise OSError("disk full")
+
+    worker = PeriodicWorker(callback, 0.01)
+    worker.ensure_started()
+    for _ in range(200):
+        if len(calls) >= 2:
+            break
+        time.sleep(0.01)
+    worker.stop()
+    assert len(calls) >= 2
+
+
+def test_journal_keeps_updates_when_append_fails(tmp_path):
+    path = str(tmp_path / "missing" / "q_values.json")
+    journal = QValueJournal(path)
+    tables = {"pool": {"a": 0.0}}
+    journal.load(tables)
+    journal.record("pool", "a", 0.5)
+    with pytest.raises(OSError):
+        journal.flush()
+    journal.record("pool", "b", 0.25)
+
+    os.mkdir(tmp_path / "missing")
+    journal.flush()
+    journal.close()
+    restored = {"pool": {}}
+    assert replay_q_values(path, restored) == (2, 2)
+    assert restored == {"pool": {"a": 0.5, "b": 0.25}}
@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from persistence import replay_q_values
+from train_offline import iter_reply_reactions
+
+
+def test_replies_are_paired_with_the_next_user_message():
+    history = {"conversation_history": [
+        {"role": "user", "content": "hi"},
+        {"role": "bot", "content": "hello"},
+        {"role": "user", "content": "I'm stressed"},
+        {"role": "bot", "content": "take a break"},
+        {"role": "user", "content": "thanks, that helps"},
+        {"role": "bot", "content": "glad to hear"},
+    ]}
+    assert list(iter_reply_reactions([history])) == [
+        ("hi", "hello", "I'm stressed"),
+        ("I'm stressed", "take a break", "thanks, that helps"),
+    ]
+
+
+def test_per_turn_records_interleave_sessions():
+    records = [
+        {"session_id": "a", "role": "user", "content": "I'm stressed"},
+        {"session_id": "b", "role": "user", "content": "I'm sad"},
+        {"session_id": "a", "role": "bot", "content": "take a break"},
+        {"session_id": "b", "role": "bot", "content": "I'm sorry"},
+        {"session_id": "b", "role": "user", "content": "that's useless"},
+        {"session_id": "a", "role": "user", "content": "good idea"},
+    ]
+    assert list(iter_reply_reactions(records)) == [
+        ("I'm sad", "I'm sorry", "that's useless"),
+        ("I'm stressed", "take a break", "good idea"),
+    ]
+
+
+def test_main_output_survives_exit_with_long_delta_log(tmp_path):
+    # Run in a subprocess so the imported app's exit handlers run as they would in production
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "q_values.json")) as f:
+        snapshot = json.load(f)
+    reply = next(iter(snapshot["sad_responses"]))
+    snapshot["sad_responses"][reply] = -0.5
+    snapshot["_seq"] = 0
+    (tmp_path / "q_values.json").write_text(json.dumps(snapshot))
+    # Enough records that the journal would compact at exit
+    with open(tmp_path / "q_values.json.log", "w") as f:
+        for seq in range(1, 1201):
+            f.write(json.dumps([seq, "sad_responses", reply, -0.5]) + "\n")
+    with open(tmp_path / "turns.jsonl", "w") as f:
+        for _ in range(200):
+            f.write(json.dumps([{"role": "user", "content": "I feel sad"}, {"role": "bot", "content": reply},
+                                {"role": "user", "content": "Thanks, that really helps, I love it!"}]) + "\n")
+
+    subprocess.run([sys.executable, os.path.join(root, "train_offline.py"), "turns.jsonl", "--init", "q_values.json",
+                    "--output", "q_values.json"], cwd=tmp_path, check=True, capture_output=True)
+
+    with open(tmp_path / "q_values.json") as f:
+        trained = json.load(f)
+    assert trained["_seq"] == 1200
+    assert trained["sad_responses"][reply] > 0.9
+    tables = {name: {} for name in trained if not name.startswith("_")}
+    replay_q_values(str(tmp_path / "q_values.json"), tables)
+    assert tables["sad_responses"][reply] == trained["sad_responses"][reply]
@@ -0,0 +1,235 @@
+"""
+Rebuild q_values.json offline by replaying logged conversations.
+
+Each line of a log file is JSON, either a whole conversation (a list of
+{"role", "content"} turns, or an object with a "conversation_history" list) or a
+single turn {"session_id", "role", "content"}. A directory is read as the segment
+log written by conversation_log.py.
+Every bot reply drawn from a response pool is credited with the sentiment reward
+of the user's next message, their reaction to it, exactly as chat() does, and the
+update rule is applied in vectorized batches. Replies the user never answered are
+not learned from. Logs are streamed, so memory use does not depend on their size.
+
+The output's `_seq` is set to the last sequence number in its existing delta log
+(`<output>.log`), so the log's records are not replayed over the trained values.
+Stop the server before replacing its q_values.json: a running server keeps its own
+values and writes them back at the next compaction. The trainer imports chatbot.py
+for its pools and routing but detaches its write-behind writers, so they never
+write at exit.
+
+Usage:
+    python train_offline.py logs/*.jsonl --output q_values.json
+    python train_offline.py conversations --output q_values.json
+    python train_offline.py - --learning-rate 0.05 --positive-threshold 0.2 < logs.jsonl
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from conversation_log import ConversationLog
+from persistence import atomic_write_json, last_seq
+
+
+def reward_from_compound(compound, positive_threshold=0.05, negative_threshold=-0.05):
+    """Vectorized version of the reward rule in chat(): +1, -1 or 0 by compound score."""
+    return np.where(compound >= positive_threshold, 1.0, np.where(compound <= negative_threshold, -1.0, 0.0))
+
+
+def apply_updates(values, keys, rewards, learning_rate):
+    """
+    Apply Q_new = Q_old + learning_rate * (reward - Q_old) for every (key, reward)
+    pair to `values` in place, in order, using array operations. n updates to one key
+    collapse to Q_n = (1 - a)^n * Q_0 + sum_i a * (1 - a)^(n - 1 - i) * r_i.
+    """
+    if len(keys) == 0:
+        return
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    rewards = rewards[order]
+    unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    positions = np.arange(len(keys)) - np.repeat(starts, counts)
+    remaining = np.repeat(counts, counts) - 1 - positions
+    weighted = learning_rate * (1 - learning_rate) ** remaining * rewards
+    values[unique_keys] = (1 - learning_rate) ** counts * values[unique_keys] + np.add.reduceat(weighted, starts)
+
+
+def parse_lines(lines):
+    """Yield the records of JSONL log lines, skipping blank lines."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_reply_reactions(records, max_open_sessions=100000):
+    """
+    Yield (user message, bot reply, user's next message) triples from log records.
+    For per-turn logs, the open turn of at most `max_open_sessions` sessions is
+    remembered until the session's next user message arrives.
+    """
+    open_turns = OrderedDict()
+    for record in records:
+        if isinstance(record, dict) and "role" in record:
+            session_id = record.get("session_id")
+            # [user message, bot reply or None]
+            turn = open_turns.get(session_id)
+            if record["role"] == "user":
+                if turn is not None and turn[1] is not None:
+                    yield turn[0], turn[1], record["content"]
+                open_turns[session_id] = [record["content"], None]
+                open_turns.move_to_end(session_id)
+                if len(open_turns) > max_open_sessions:
+                    open_turns.popitem(last=False)
+            elif turn is not None and turn[1] is None:
+                turn[1] = record["content"]
+            continue
+        turns = record.get("conversation_history", []) if isinstance(record, dict) else record
+        prompt = reply = None
+        for turn in turns:
+            if turn["role"] == "user":
+                if reply is not None:
+                    yield prompt, reply, turn["content"]
+                prompt, reply = turn["content"], None
+            elif prompt is not None and reply is None:
+                reply = turn["content"]
+
+
+class ReplayTrainer:
+    """
+    Replay logged turns against the response pools in `q_tables` (name -> QTable) and
+    learn fresh Q-values for them in one flat array.
+    """
+
+    def __init__(self, q_tables, sentiment, learning_rate=0.1, positive_threshold=0.05,
+                 negative_threshold=-0.05, batch_size=10000, route=None):
+        self.sentiment = sentiment
+        self.learning_rate = learning_rate
+        self.positive_threshold = positive_threshold
+        self.negative_threshold = negative_threshold
+        self.batch_size = batch_size
+        self.route = route
+        self.names = list(q_tables)
+        self.texts = []
+        self.keys = {}
+        self.table_of = []
+        for name in self.names:
+            for text in q_tables[name]:
+                self.keys[text] = len(self.texts)
+                self.texts.append(text)
+                self.table_of.append(name)
+        self.values = np.zeros(len(self.texts))
+        self.stats = {"pairs": 0, "updates": 0, "skipped": 0, "rerouted": 0}
+
+    def load(self, filepath):
+        """Start from the Q-values in an existing q_values.json instead of zeros."""
+        with open(filepath, "r") as f:
+            data = json.load(f)
+        for name in self.names:
+            for text, value in data.get(name, {}).items():
+                if text in self.keys:
+                    self.values[self.keys[text]] = value
+
+    def train(self, turns):
+        """Learn from (user message, bot reply, user's next message) triples."""
+        batch_messages = []
+        batch_keys = []
+        for user_message, bot_reply, reaction in turns:
+            self.stats["pairs"] += 1
+            key = self.keys.get(bot_reply)
+            if key is None:
+                self.stats["skipped"] += 1
+                continue
+            if self.route is not None and self.route(user_message) not in (None, self.table_of[key]):
+                # The current intent keywords would have sent this message to a different pool
+                self.stats["rerouted"] += 1
+                continue
+            batch_messages.append(reaction)
+            batch_keys.append(key)
+            if len(batch_keys) >= self.batch_size:
+                self._flush(batch_messages, batch_keys)
+                batch_messages, batch_keys = [], []
+        self._flush(batch_messages, batch_keys)
+
+    def _flush(self, messages, keys):
+        if not keys:
+            return
+        compound = np.array([scores["compound"] for scores in self.sentiment.score_batch(messages)])
+        rewards = reward_from_compound(compound, self.positive_threshold, self.negative_threshold)
+        apply_updates(self.values, np.array(keys), rewards, self.learning_rate)
+        self.stats["updates"] += len(keys)
+
+    def q_values(self):
+        """Return the learned values in the q_values.json layout."""
+        data = {name: {} for name in self.names}
+        for key, text in enumerate(self.texts):
+            data[self.table_of[key]][text] = float(self.values[key])
+        return data
+
+
+def detach_writers(chatbot):
+    """
+    Stop the imported app's write-behind writers from running at exit. Only its pools,
+    sentiment service and routing are used here, and a journal compaction at exit
+    would overwrite the trained output with the values the app loaded at import.
+    """
+    writers = [chatbot.q_journal, chatbot.q_contexts, chatbot.conversation_log, chatbot.profile_store]
+    if chatbot.q_sync is not None:
+        writers.append(chatbot.q_sync)
+    for writer in writers:
+        atexit.unregister(writer.close)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild q_values.json from logged conversations.")
+    parser.add_argument("logs", nargs="+",
+                        help="JSONL log files, conversation log directories, or - for standard input")
+    parser.add_argument("--output", default="q_values.json")
+    parser.add_argument("--init", help="start from this q_values.json instead of zeros")
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--positive-threshold", type=float, default=0.05)
+    parser.add_argument("--negative-threshold", type=float, default=-0.05)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--strict-intents", action="store_true",
+                        help="skip turns the current intent keywords would route to a different pool")
+    args = parser.parse_args(argv)
+
+    import chatbot
+    detach_writers(chatbot)
+
+    trainer = ReplayTrainer(
+        chatbot.q_tables, chatbot.sentiment,
+        learning_rate=args.learning_rate,
+        positive_threshold=args.positive_threshold,
+        negative_threshold=args.negative_threshold,
+        batch_size=args.batch_size,
+        route=chatbot.intent_pool if args.strict_intents else None
+    )
+    if args.init:
+        trainer.load(args.init)
+
+    def records():
+        for path in args.logs:
+            if path == "-":
+                yield from parse_lines(sys.stdin)
+            elif os.path.isdir(path):
+                yield from ConversationLog(path).iter_turns()
+            else:
+                with open(path, "r") as f:
+                    yield from parse_lines(f)
+
+    trainer.train(iter_reply_reactions(records()))
+    data = trainer.q_values()
+    # Mark the records already in the output's delta log as superseded, so they are not
+    # replayed over the trained values at the next start
+    data["_seq"] = last_seq(args.output)
+    atomic_write_json(args.output, data)
+    print(json.dumps(trainer.stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()